@@ -1,26 +1,42 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from docx import Document
+import importlib.util
 import io
-import re
 from datetime import datetime
 import json
 import time
 
-# Import có điều kiện
-try:
-    import plotly.express as px
-    import plotly.graph_objects as go
-    PLOTLY_AVAILABLE = True
-except ImportError:
-    PLOTLY_AVAILABLE = False
+from core.affordability import DEFAULT_POLICY, solve_affordability
+from core.ai import GENAI_AVAILABLE, analyze_with_gemini, chat_with_gemini, get_response_cache
+from core.amortization import (
+    build_rate_path,
+    create_repayment_schedule,
+    schedule_to_dataframe,
+    variable_rate_schedule,
+)
+from core.daycount import actual365_schedule, fixed_holidays, parse_holidays, to_date
+from core.export import export_appraisal_report, export_to_excel
+from core.extraction import get_extraction_cache
+from core.formatting import (
+    format_number,
+    format_number_international,
+    parse_number_international,
+)
+from core.hedge import hedge_stats, hedging_enabled
+from core.jobs import JOB_DONE, JOB_QUEUED, JOB_RUNNING, get_ai_job_runner
+from core.mapreduce import analyze_document, plan_document
+from core.metrics import calculate_financial_metrics
+from core.prefetch import get_background_extractor
+from core.prepayment import KEEP_PAYMENT, KEEP_TERM, segment_balances, simulate_prepayments
+from core.ratelimit import get_gemini_limiter
+from core.retrieval import retrieve_passages
+from core.rules import appraisal_frame, evaluate_rules, load_rules, rule_delta
+from core.sensitivity import default_grid, metrics_grid
+from core.stress import simulate_stress
 
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except ImportError:
-    GENAI_AVAILABLE = False
+# Import có điều kiện: plotly chỉ được nạp khi vẽ biểu đồ
+PLOTLY_AVAILABLE = importlib.util.find_spec('plotly') is not None
 
 # Cấu hình trang
 st.set_page_config(
@@ -204,361 +220,130 @@ if 'data_modified' not in st.session_state:
     st.session_state.data_modified = False
 if 'uploaded_content' not in st.session_state:
     st.session_state.uploaded_content = ""
-if 'last_request_time' not in st.session_state:
-    st.session_state.last_request_time = 0
-
-# Hàm định dạng số
-def format_number(num):
-    """Định dạng số với dấu chấm phân cách hàng nghìn"""
-    try:
-        return "{:,.0f}".format(float(num)).replace(",", ".")
-    except:
-        return str(num)
-
-def format_number_international(num):
-    """Định dạng số theo chuẩn quốc tế (dấu phẩy phân cách hàng nghìn)"""
-    try:
-        return "{:,.0f}".format(float(num))
-    except:
-        return str(num)
-
-def parse_number(text):
-    """Chuyển đổi text thành số"""
-    try:
-        clean_text = str(text).replace(".", "").replace(",", ".")
-        return float(clean_text)
-    except:
-        return 0
-
-def parse_number_international(text):
-    """Chuyển đổi text theo chuẩn quốc tế thành số"""
-    try:
-        # Loại bỏ dấu phẩy (thousands separator)
-        clean_text = str(text).replace(",", "")
-        return float(clean_text)
-    except:
-        return 0
+if 'ai_jobs' not in st.session_state:
+    st.session_state.ai_jobs = {}
 
 # Hàm trích xuất thông tin từ file docx
 def extract_info_from_docx(file):
-    """Trích xuất thông tin từ file docx"""
-    doc = Document(file)
-    full_text = '\n'.join([para.text for para in doc.paragraphs])
-    st.session_state.uploaded_content = full_text
-    
-    customer_info = {}
-    financial_info = {}
-    collateral_info = {}
-    
-    # Trích xuất thông tin khách hàng
-    name_match = re.search(r'Họ và tên:\s*([^\n\r-]+)', full_text)
-    if name_match:
-        customer_info['name'] = name_match.group(1).strip()
-    
-    cccd_match = re.search(r'(?:CMND/)?CCCD(?:/hộ chiếu)?:\s*(\d+)', full_text)
-    if cccd_match:
-        customer_info['cccd'] = cccd_match.group(1).strip()
-    
-    address_match = re.search(r'Nơi cư trú:\s*([^\n\r]+)', full_text)
-    if address_match:
-        customer_info['address'] = address_match.group(1).strip()
-    
-    phone_match = re.search(r'Số điện thoại:\s*(\d+)', full_text)
-    if phone_match:
-        customer_info['phone'] = phone_match.group(1).strip()
-    
-    email_match = re.search(r'Email:\s*([^\s\n\r]+)', full_text)
-    if email_match:
-        customer_info['email'] = email_match.group(1).strip()
-    
-    # Trích xuất thông tin tài chính
-    total_need_match = re.search(r'Tổng nhu cầu vốn:\s*([\d.,]+)\s*đồng', full_text)
-    if total_need_match:
-        financial_info['total_need'] = parse_number(total_need_match.group(1))
-    
-    equity_match = re.search(r'Vốn đối ứng[^:]*:\s*([\d.,]+)\s*đồng', full_text)
-    if equity_match:
-        financial_info['equity'] = parse_number(equity_match.group(1))
-    
-    loan_match = re.search(r'Vốn vay[^:]*số tiền:\s*([\d.,]+)\s*đồng', full_text)
-    if loan_match:
-        financial_info['loan_amount'] = parse_number(loan_match.group(1))
-    
-    interest_match = re.search(r'Lãi suất:\s*([\d.,]+)%', full_text)
-    if interest_match:
-        financial_info['interest_rate'] = float(interest_match.group(1).replace(',', '.'))
-    
-    term_match = re.search(r'Thời hạn vay:\s*(\d+)\s*tháng', full_text)
-    if term_match:
-        financial_info['loan_term'] = int(term_match.group(1))
-    
-    purpose_match = re.search(r'Mục đích vay:\s*([^\n\r]+)', full_text)
-    if purpose_match:
-        financial_info['purpose'] = purpose_match.group(1).strip()
-    
-    income_patterns = [
-        r'Tổng thu nhập[^:]*:\s*([\d.,]+)\s*đồng',
-        r'Thu nhập[^:]*:\s*([\d.,]+)\s*đồng/tháng'
-    ]
-    for pattern in income_patterns:
-        income_match = re.search(pattern, full_text)
-        if income_match:
-            financial_info['monthly_income'] = parse_number(income_match.group(1))
-            break
-    
-    expense_match = re.search(r'Tổng chi phí hàng tháng:\s*([\d.,]+)', full_text)
-    if expense_match:
-        financial_info['monthly_expense'] = parse_number(expense_match.group(1))
-    
-    project_income_match = re.search(r'Thu nhập từ kinh doanh[^:]*:\s*([\d.,]+)\s*đồng/tháng', full_text)
-    if project_income_match:
-        financial_info['project_income'] = parse_number(project_income_match.group(1))
-    
-    # Trích xuất thông tin tài sản đảm bảo
-    collateral_type_match = re.search(r'Tài sản \d+:\s*([^\n\r.]+)', full_text)
-    if collateral_type_match:
-        collateral_info['type'] = collateral_type_match.group(1).strip()
-    
-    collateral_value_patterns = [
-        r'Giá trị:\s*([\d.,]+)\s*đồng',
-        r'Giá trị[^:]*:\s*([\d.,]+)\s*đồng'
-    ]
-    for pattern in collateral_value_patterns:
-        collateral_value_match = re.search(pattern, full_text)
-        if collateral_value_match:
-            collateral_info['value'] = parse_number(collateral_value_match.group(1))
-            break
-    
-    collateral_address_match = re.search(r'Địa chỉ:\s*([^\n\r]+?)(?:Diện tích|Giấy|Tỷ lệ|\n|$)', full_text)
-    if collateral_address_match:
-        collateral_info['address'] = collateral_address_match.group(1).strip()
-    
-    area_match = re.search(r'Diện tích đất:\s*([\d.,]+)\s*m', full_text)
-    if area_match:
-        collateral_info['area'] = parse_number(area_match.group(1))
-    
-    return customer_info, financial_info, collateral_info
+    """Trích xuất thông tin từ file docx (dùng kết quả trích xuất nền/cache nếu có)"""
+    data = file.getvalue()
+    extractor = get_background_extractor()
+    key = st.session_state.get('prefetch_key') or extractor.cache.key(data)
+    result, source = extractor.get(key, data)
+    st.session_state.uploaded_content = result['text']
+    st.session_state.extraction_report = result['report']
+    st.session_state.extraction_source = source
+    
+    return result['customer'], result['financial'], result['collateral']
 
-# Hàm tính toán các chỉ tiêu tài chính
-def calculate_financial_metrics(financial_info):
-    """Tính toán các chỉ tiêu tài chính"""
-    metrics = {}
-    
-    loan_amount = financial_info.get('loan_amount', 0)
-    interest_rate = financial_info.get('interest_rate', 0)
-    loan_term = financial_info.get('loan_term', 0)
-    monthly_income = financial_info.get('monthly_income', 0)
-    monthly_expense = financial_info.get('monthly_expense', 0)
-    project_income = financial_info.get('project_income', 0)
-    
-    if loan_amount > 0 and interest_rate > 0 and loan_term > 0:
-        monthly_rate = (interest_rate / 100) / 12
-        
-        if monthly_rate > 0:
-            monthly_payment = loan_amount * (monthly_rate * (1 + monthly_rate)**loan_term) / \
-                            ((1 + monthly_rate)**loan_term - 1)
-        else:
-            monthly_payment = loan_amount / loan_term
-        
-        metrics['first_month_payment'] = monthly_payment
-        
-        total_payment = monthly_payment * loan_term
-        total_interest = total_payment - loan_amount
-        metrics['total_interest'] = total_interest
-        metrics['total_payment'] = total_payment
-        
-        net_income = monthly_income + project_income - monthly_expense
-        metrics['net_income'] = net_income
-        
-        if monthly_income > 0:
-            debt_service_ratio = (monthly_payment / monthly_income) * 100
-            metrics['debt_service_ratio'] = debt_service_ratio
-        else:
-            metrics['debt_service_ratio'] = 0
-        
-        if monthly_payment > 0:
-            dscr = net_income / monthly_payment
-            metrics['dscr'] = dscr
-        else:
-            metrics['dscr'] = 0
-        
-        surplus = net_income - monthly_payment
-        metrics['surplus'] = surplus
-    
-    return metrics
+# Hàm dựng nội dung chỉ số tài chính gửi cho AI
+def build_metrics_content():
+    """Tóm tắt hồ sơ và các chỉ tiêu tài chính hiện tại thành văn bản cho prompt phân tích"""
+    return f"""
+THÔNG TIN KHÁCH HÀNG:
+- Tên: {st.session_state.customer_info.get('name', 'N/A')}
+- CCCD: {st.session_state.customer_info.get('cccd', 'N/A')}
 
-# Hàm tạo lịch trả nợ
-def create_repayment_schedule(loan_amount, interest_rate, loan_term):
-    """Tạo lịch trả nợ chi tiết"""
-    schedule = []
-    monthly_rate = (interest_rate / 100) / 12
-    
-    if monthly_rate > 0:
-        monthly_payment = loan_amount * (monthly_rate * (1 + monthly_rate)**loan_term) / \
-                        ((1 + monthly_rate)**loan_term - 1)
-    else:
-        monthly_payment = loan_amount / loan_term
-    
-    remaining_balance = loan_amount
-    
-    for month in range(1, loan_term + 1):
-        interest_payment = remaining_balance * monthly_rate
-        principal_payment = monthly_payment - interest_payment
-        
-        if month == loan_term:
-            principal_payment = remaining_balance
-            monthly_payment = principal_payment + interest_payment
-        
-        schedule.append({
-            'Kỳ': month,
-            'Dư nợ đầu kỳ': remaining_balance,
-            'Tiền gốc': principal_payment,
-            'Tiền lãi': interest_payment,
-            'Tổng trả': monthly_payment,
-            'Dư nợ cuối kỳ': remaining_balance - principal_payment
-        })
-        
-        remaining_balance -= principal_payment
-    
-    return pd.DataFrame(schedule)
+THÔNG TIN THU NHẬP:
+- Thu nhập hàng tháng: {format_number(st.session_state.financial_info.get('monthly_income', 0))} đồng
+- Chi phí hàng tháng: {format_number(st.session_state.financial_info.get('monthly_expense', 0))} đồng
 
-# Hàm xuất Excel
-def export_to_excel(df):
-    """Xuất DataFrame sang Excel"""
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Lịch Trả Nợ')
-        
-        workbook = writer.book
-        worksheet = writer.sheets['Lịch Trả Nợ']
-        
-        for column in worksheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    return output.getvalue()
+THÔNG TIN VAY VỐN:
+- Số tiền vay: {format_number(st.session_state.financial_info.get('loan_amount', 0))} đồng
+- Lãi suất: {st.session_state.financial_info.get('interest_rate', 0)}%/năm
+- Thời hạn: {st.session_state.financial_info.get('loan_term', 0)} tháng
 
-# Hàm xuất báo cáo Word
-def export_appraisal_report(customer_info, financial_info, collateral_info, metrics, analysis_file="", analysis_metrics=""):
-    """Xuất báo cáo thẩm định sang Word"""
-    doc = Document()
-    
-    title = doc.add_heading('BÁO CÁO THẨM ĐỊNH PHƯƠNG ÁN KINH DOANH', 0)
-    title.alignment = 1
-    
-    doc.add_heading('I. THÔNG TIN KHÁCH HÀNG', 1)
-    doc.add_paragraph(f"Họ và tên: {customer_info.get('name', 'N/A')}")
-    doc.add_paragraph(f"CCCD: {customer_info.get('cccd', 'N/A')}")
-    doc.add_paragraph(f"Địa chỉ: {customer_info.get('address', 'N/A')}")
-    doc.add_paragraph(f"Điện thoại: {customer_info.get('phone', 'N/A')}")
-    doc.add_paragraph(f"Email: {customer_info.get('email', 'N/A')}")
-    
-    doc.add_heading('II. THÔNG TIN TÀI CHÍNH', 1)
-    doc.add_paragraph(f"Số tiền vay: {format_number(financial_info.get('loan_amount', 0))} đồng")
-    doc.add_paragraph(f"Lãi suất: {financial_info.get('interest_rate', 0)}%/năm")
-    doc.add_paragraph(f"Thời hạn: {financial_info.get('loan_term', 0)} tháng")
-    doc.add_paragraph(f"Mục đích vay: {financial_info.get('purpose', 'N/A')}")
-    doc.add_paragraph(f"Thu nhập hàng tháng: {format_number(financial_info.get('monthly_income', 0))} đồng")
-    doc.add_paragraph(f"Chi phí hàng tháng: {format_number(financial_info.get('monthly_expense', 0))} đồng")
-    
-    doc.add_heading('III. TÀI SẢN ĐẢM BẢO', 1)
-    doc.add_paragraph(f"Loại tài sản: {collateral_info.get('type', 'N/A')}")
-    doc.add_paragraph(f"Giá trị: {format_number(collateral_info.get('value', 0))} đồng")
-    doc.add_paragraph(f"Địa chỉ: {collateral_info.get('address', 'N/A')}")
-    
-    doc.add_heading('IV. CÁC CHỈ TIÊU TÀI CHÍNH', 1)
-    doc.add_paragraph(f"Trả nợ hàng tháng: {format_number(metrics.get('first_month_payment', 0))} đồng")
-    doc.add_paragraph(f"Thu nhập ròng: {format_number(metrics.get('net_income', 0))} đồng")
-    doc.add_paragraph(f"Tỷ lệ trả nợ/thu nhập: {metrics.get('debt_service_ratio', 0):.2f}%")
-    doc.add_paragraph(f"DSCR: {metrics.get('dscr', 0):.2f}")
-    doc.add_paragraph(f"Số dư sau trả nợ: {format_number(metrics.get('surplus', 0))} đồng")
-    doc.add_paragraph(f"Tổng lãi phải trả: {format_number(metrics.get('total_interest', 0))} đồng")
-    
-    if analysis_file or analysis_metrics:
-        doc.add_heading('V. PHÂN TÍCH AI', 1)
-        if analysis_file:
-            doc.add_heading('Phân tích từ file gốc:', 2)
-            doc.add_paragraph(analysis_file)
-        if analysis_metrics:
-            doc.add_heading('Phân tích từ các chỉ số tài chính:', 2)
-            doc.add_paragraph(analysis_metrics)
-    
-    doc.add_paragraph(f"\nNgày lập: {datetime.now().strftime('%d/%m/%Y')}")
-    
-    output = io.BytesIO()
-    doc.save(output)
-    return output.getvalue()
+CÁC CHỈ TIÊU TÀI CHÍNH:
+- Trả nợ hàng tháng: {format_number(st.session_state.metrics.get('first_month_payment', 0))} đồng
+- Thu nhập ròng: {format_number(st.session_state.metrics.get('net_income', 0))} đồng
+- Tỷ lệ trả nợ/thu nhập: {st.session_state.metrics.get('debt_service_ratio', 0):.2f}%
+- DSCR: {st.session_state.metrics.get('dscr', 0):.2f}
+- Số dư sau trả nợ: {format_number(st.session_state.metrics.get('surplus', 0))} đồng
+- Tổng lãi phải trả: {format_number(st.session_state.metrics.get('total_interest', 0))} đồng
 
-# Hàm cấu hình Gemini
-def configure_gemini(api_key):
-    """Cấu hình Gemini API"""
-    if GENAI_AVAILABLE:
-        genai.configure(api_key=api_key)
+TÀI SẢN ĐẢM BẢO:
+- Loại: {st.session_state.collateral_info.get('type', 'N/A')}
+- Giá trị: {format_number(st.session_state.collateral_info.get('value', 0))} đồng
+- LTV: {(st.session_state.financial_info.get('loan_amount', 0) / st.session_state.collateral_info.get('value', 1) * 100):.2f}%
+"""
 
-# Hàm retry với exponential backoff
-def retry_with_backoff(func, max_retries=3, base_delay=1):
-    """Retry function với exponential backoff"""
-    for attempt in range(max_retries):
-        try:
-            return func()
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            delay = base_delay * (2 ** attempt)
-            time.sleep(delay)
+# Hàm hiển thị trạng thái giới hạn tốc độ Gemini
+def show_rate_limit():
+    """Dòng trạng thái hàng đợi gọi Gemini dùng chung cho mọi phiên"""
+    limiter = get_gemini_limiter()
+    limit_stats = limiter.stats()
+    message = f"🚦 Giới hạn Gemini: {limiter.rpm:.0f} yêu cầu/phút cho toàn hệ thống"
+    if limit_stats['queued']:
+        message += f" · {limit_stats['queued']} yêu cầu đang chờ"
+    if limit_stats['next_wait'] >= 1:
+        message += f" · yêu cầu mới chờ khoảng {limit_stats['next_wait']:.0f}s"
+    st.caption(message)
 
-# Hàm phân tích với Gemini
-def analyze_with_gemini(api_key, analysis_type, content):
-    """Phân tích dữ liệu bằng Gemini AI"""
-    if not GENAI_AVAILABLE:
-        return "⚠️ Thư viện google-generativeai chưa được cài đặt!"
-    
-    try:
-        configure_gemini(api_key)
-        
-        def make_request():
-            model = genai.GenerativeModel('gemini-2.0-flash')
-            
-            if analysis_type == "file":
-                prompt = f"""
-Bạn là chuyên gia thẩm định tín dụng ngân hàng. Hãy phân tích phương án kinh doanh sau và đưa ra đánh giá chi tiết:
+# Hàm gửi tác vụ phân tích AI chạy nền
+def submit_analysis(kind, api_key, content, force_refresh=False):
+    """Gửi phân tích ("file" hoặc "metrics") vào bộ chạy nền; id tác vụ lưu theo phiên.
 
-{content}
+    File gốc dài được phân tích theo từng phần rồi tổng hợp (map-reduce).
+    """
+    if kind in st.session_state.ai_jobs:
+        return
+    runner = get_ai_job_runner()
+    if kind == "file":
+        job_id = runner.submit(kind, analyze_document, api_key, content, force_refresh=force_refresh)
+    else:
+        job_id = runner.submit(kind, analyze_with_gemini, api_key, kind, content, force_refresh=force_refresh)
+    st.session_state.ai_jobs[kind] = job_id
 
-Vui lòng phân tích theo các khía cạnh:
-1. Tính khả thi của dự án
-2. Khả năng tài chính của khách hàng
-3. Rủi ro tiềm ẩn
-4. Khuyến nghị cho ngân hàng (nên cho vay hay từ chối, điều kiện gì)
-"""
+# Hàm thu kết quả tác vụ AI
+def collect_ai_jobs():
+    """Chuyển kết quả các tác vụ AI đã xong vào session_state; trả về các tác vụ còn chạy"""
+    runner = get_ai_job_runner()
+    running = {}
+    for kind, job_id in list(st.session_state.ai_jobs.items()):
+        job = runner.get(job_id)
+        if job is not None and job['status'] in (JOB_QUEUED, JOB_RUNNING):
+            running[kind] = job
+            continue
+        if job is not None:
+            if job['status'] == JOB_DONE:
+                analysis, cached_at = job['result']
             else:
-                prompt = f"""
-Bạn là chuyên gia thẩm định tín dụng. Dựa trên các chỉ số tài chính sau, hãy đánh giá khả năng trả nợ và rủi ro:
+                analysis, cached_at = f"❌ Lỗi khi phân tích: {job['error']}", None
+            st.session_state[f'analysis_{kind}'] = analysis
+            st.session_state[f'analysis_{kind}_cached_at'] = cached_at
+        del st.session_state.ai_jobs[kind]
+    return running
 
-{content}
+# Hàm hiển thị tiến độ tác vụ AI
+def show_ai_jobs(kind):
+    """Tiến độ các tác vụ AI của phiên và văn bản đang stream của loại `kind`.
 
-Hãy phân tích:
-1. Đánh giá các chỉ số tài chính (DSCR, DTI, LTV)
-2. Khả năng trả nợ
-3. Mức độ rủi ro
-4. Khuyến nghị cuối cùng
-"""
-            
-            response = model.generate_content(prompt)
-            return response.text
-        
-        return retry_with_backoff(make_request)
-        
-    except Exception as e:
-        return f"❌ Lỗi khi phân tích: {str(e)}\n\nVui lòng kiểm tra API key và kết nối internet."
+    Chạy trong fragment tự làm mới mỗi giây (nếu Streamlit hỗ trợ); khi có tác
+    vụ xong thì chạy lại cả trang để kết quả hiện ở mọi tab.
+    """
+    submitted = len(st.session_state.ai_jobs)
+    running = collect_ai_jobs()
+    if len(running) < submitted:
+        st.rerun()
+    
+    labels = {'file': "📄 File gốc", 'metrics': "📊 Chỉ số tài chính"}
+    for job_kind, job in running.items():
+        waited = time.time() - job['submitted']
+        state = "đang chờ" if job['status'] == JOB_QUEUED else "đang phân tích"
+        st.caption(f"⏳ {labels[job_kind]}: {state} ({waited:.0f}s)")
+    
+    job = running.get(kind)
+    if job is not None and job['text']:
+        st.markdown(job['text'] + " ▌")
+    if AUTO_REFRESH is None:
+        st.button("🔄 Cập nhật kết quả", key=f"refresh_ai_{kind}")
+
+# Fragment tự làm mới (Streamlit >= 1.37); bản cũ hơn dùng nút cập nhật thủ công
+AUTO_REFRESH = getattr(st, 'fragment', None)
+if AUTO_REFRESH is not None:
+    show_ai_jobs = AUTO_REFRESH(run_every=1)(show_ai_jobs)
+
+collect_ai_jobs()
 
 # ===== GIAO DIỆN CHÍNH =====
 
@@ -575,7 +360,21 @@ with st.sidebar:
         help="Chọn file phương án sử dụng vốn định dạng .docx"
     )
     
+    # Trích xuất nền ngay khi có file mới; file đổi thì hủy tác vụ cũ
+    extractor = get_background_extractor()
+    upload_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name if uploaded_file else None)
+    if upload_id != st.session_state.get('prefetch_upload_id'):
+        if st.session_state.get('prefetch_key'):
+            extractor.cancel(st.session_state.prefetch_key)
+        st.session_state.prefetch_key = extractor.submit(uploaded_file.getvalue()) if uploaded_file else None
+        st.session_state.prefetch_upload_id = upload_id
+    
     if uploaded_file is not None:
+        if extractor.status(st.session_state.prefetch_key) == 'running':
+            st.caption("⏳ Đang trích xuất nền...")
+        else:
+            st.caption("✅ Dữ liệu file đã sẵn sàng")
+        
         if st.button("🔍 Trích Xuất Dữ Liệu", use_container_width=True):
             with st.spinner("Đang xử lý..."):
                 customer_info, financial_info, collateral_info = extract_info_from_docx(uploaded_file)
@@ -586,6 +385,12 @@ with st.sidebar:
                 st.session_state.data_modified = False
                 st.success("✅ Trích xuất thành công!")
                 st.rerun()
+        
+        cache_stats = get_extraction_cache().stats()
+        st.caption(
+            f"⚡ Cache trích xuất: {cache_stats['memory_hits'] + cache_stats['disk_hits']} lần trúng "
+            f"({cache_stats['disk_hits']} từ đĩa) / {cache_stats['misses']} lần trượt"
+        )
     
     st.markdown("---")
     
@@ -610,6 +415,22 @@ with st.sidebar:
         if st.session_state.data_modified:
             st.warning("⚠️ Dữ liệu đã được chỉnh sửa")
         
+        if st.session_state.get('extraction_source') in ('cache', 'prefetch'):
+            st.info("⚡ Dữ liệu đã được chuẩn bị sẵn (cache/trích xuất nền)")
+        
+        report = st.session_state.get('extraction_report')
+        if report:
+            with st.expander(f"🔎 Chi tiết trích xuất ({len(report)} trường)"):
+                st.dataframe(pd.DataFrame([
+                    {
+                        'Trường': item['label'],
+                        'Giá trị': str(item['value']),
+                        'Tin cậy': f"{item['confidence']:.0%}",
+                        'Vị trí': f"{item['span'][0]}-{item['span'][1]}"
+                    }
+                    for item in report.values()
+                ]), use_container_width=True, hide_index=True)
+        
         if st.button("🔄 Reset Dữ Liệu", use_container_width=True):
             st.session_state.data_extracted = False
             st.session_state.customer_info = {}
@@ -748,6 +569,54 @@ if st.session_state.data_extracted:
             st.success("✅ Đã lưu thông tin tài chính!")
             st.rerun()
     
+        # Bài toán ngược: giải khả năng vay theo chính sách
+        with st.expander("🎯 Khả Năng Vay Tối Đa Theo Chính Sách", expanded=False):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                policy_dscr = st.number_input("DSCR tối thiểu", min_value=0.1,
+                                              value=DEFAULT_POLICY['min_dscr'], step=0.05, format="%.2f")
+            with col2:
+                policy_dti = st.number_input("DTI tối đa (%)", min_value=1.0,
+                                             value=DEFAULT_POLICY['max_dti'], step=1.0, format="%.1f")
+            with col3:
+                policy_ltv = st.number_input("LTV tối đa (%)", min_value=1.0,
+                                             value=DEFAULT_POLICY['max_ltv'], step=1.0, format="%.1f")
+            
+            solution = solve_affordability(
+                {
+                    'loan_amount': loan_amount,
+                    'interest_rate': interest_rate,
+                    'loan_term': loan_term,
+                    'monthly_income': monthly_income,
+                    'monthly_expense': monthly_expense,
+                    'project_income': project_income
+                },
+                collateral_value=st.session_state.collateral_info.get('value', 0),
+                policy={'min_dscr': policy_dscr, 'max_dti': policy_dti, 'max_ltv': policy_ltv}
+            )
+            binding_labels = {'dscr': 'DSCR', 'dti': 'DTI', 'ltv': 'LTV'}
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(
+                    "Số tiền vay tối đa",
+                    f"{format_number(solution['max_loan_amount'])} đ",
+                    help=f"Ràng buộc chặt nhất: {binding_labels[solution['binding_constraint']]}"
+                )
+            with col2:
+                term_text = f"{solution['shortest_term']} tháng" if solution['shortest_term'] else "Không khả thi"
+                st.metric("Thời hạn ngắn nhất", term_text)
+            with col3:
+                rate = solution['breakeven_rate']
+                rate_text = f"{rate:.2f}%/năm" if rate is not None and not np.isnan(rate) else "Không khả thi"
+                st.metric("Lãi suất hòa vốn", rate_text)
+            
+            st.caption(
+                f"Trả nợ tối đa cho phép: {format_number(solution['max_payment'])} đ/tháng "
+                f"(ràng buộc {binding_labels[solution['binding_constraint']]}); "
+                f"trả nợ hiện tại: {format_number(solution['current_payment'])} đ/tháng"
+            )
+    
     # TAB 3: Tài sản đảm bảo
     with tabs[2]:
         st.subheader("🏠 Tài Sản Đảm Bảo")
@@ -803,6 +672,11 @@ if st.session_state.data_extracted:
         
         if 'metrics' in st.session_state:
             metrics = st.session_state.metrics
+            rule_set = load_rules()
+            grading = evaluate_rules(
+                appraisal_frame(st.session_state.financial_info, metrics, st.session_state.collateral_info),
+                rule_set
+            )
             
             col1, col2, col3, col4 = st.columns(4)
             
@@ -821,14 +695,14 @@ if st.session_state.data_extracted:
                 st.metric(
                     "Tỷ lệ DTI",
                     f"{dti:.2f}%",
-                    delta="Tốt" if dti < 40 else "Cao"
+                    delta=rule_delta(rule_set, grading, 'dti')
                 )
             with col4:
                 dscr = metrics.get('dscr', 0)
                 st.metric(
                     "DSCR",
                     f"{dscr:.2f}",
-                    delta="Tốt" if dscr > 1.25 else "Thấp"
+                    delta=rule_delta(rule_set, grading, 'dscr')
                 )
             
             st.markdown("---")
@@ -844,33 +718,21 @@ if st.session_state.data_extracted:
             with col2:
                 st.markdown("### 🎯 Đánh Giá")
                 
-                if dscr >= 1.25:
-                    st.success("✅ DSCR tốt - Khả năng trả nợ cao")
-                elif dscr >= 1.0:
-                    st.warning("⚠️ DSCR chấp nhận được - Cần theo dõi")
-                else:
-                    st.error("❌ DSCR thấp - Rủi ro cao")
-                
-                if dti < 40:
-                    st.success("✅ DTI tốt - Gánh nặng nợ hợp lý")
-                elif dti < 50:
-                    st.warning("⚠️ DTI cao - Cần cân nhắc")
-                else:
-                    st.error("❌ DTI quá cao - Rủi ro lớn")
-                
-                ltv = (st.session_state.financial_info.get('loan_amount', 0) / 
-                       st.session_state.collateral_info.get('value', 1)) * 100
-                st.write(f"**LTV:** {ltv:.2f}%")
+                badges = {'good': (st.success, "✅"), 'warning': (st.warning, "⚠️"), 'bad': (st.error, "❌")}
+                for rule in rule_set['rules']:
+                    if rule['id'] == 'ltv':
+                        ltv = grading['ltv'].iloc[0]
+                        st.write(f"**LTV:** {ltv:.2f}%" if np.isfinite(ltv) else "**LTV:** N/A")
+                    level = grading[f"{rule['id']}_level"].iloc[0]
+                    badge, icon = badges[level]
+                    badge(f"{icon} {rule['messages'][level]}")
                 
-                if ltv < 70:
-                    st.success("✅ LTV tốt")
-                elif ltv < 80:
-                    st.warning("⚠️ LTV trung bình")
-                else:
-                    st.error("❌ LTV cao")
+                st.write(f"**Xếp hạng tổng:** {grading['grade'].iloc[0]}")
             
             # Biểu đồ phân tích
             if PLOTLY_AVAILABLE:
+                import plotly.graph_objects as go
+                
                 st.markdown("---")
                 st.markdown("### 📊 Biểu Đồ Phân Tích")
                 
@@ -970,18 +832,185 @@ if st.session_state.data_extracted:
                     )
                     
                     st.plotly_chart(fig_bar, use_container_width=True)
+                
+                # Lưới độ nhạy lãi suất × thời hạn × cú sốc thu nhập
+                st.markdown("---")
+                st.markdown("### 🌡️ Độ Nhạy DSCR & Số Dư")
+                
+                financial_info = st.session_state.financial_info
+                grid_rates, grid_terms, grid_shocks = default_grid(
+                    financial_info.get('interest_rate', 0),
+                    int(financial_info.get('loan_term', 0))
+                )
+                grid = metrics_grid(financial_info, grid_rates, grid_terms, grid_shocks)
+                
+                shock_index = st.select_slider(
+                    "Cú sốc thu nhập",
+                    options=list(range(len(grid_shocks))),
+                    value=len(grid_shocks) // 2,
+                    format_func=lambda i: f"{grid_shocks[i] * 100:+.0f}%"
+                )
+                
+                heatmaps = [
+                    ('dscr', 'DSCR', 'RdYlGn', [(1.0, '#c0392b'), (DEFAULT_POLICY['min_dscr'], '#2c3e50')],
+                     '%{z:.2f}'),
+                    ('surplus', 'Số dư sau trả nợ (đồng)', 'RdYlGn', [(0.0, '#2c3e50')], '%{z:,.0f} đ'),
+                ]
+                col1, col2 = st.columns(2)
+                for column, (key, title, colorscale, thresholds, value_format) in zip((col1, col2), heatmaps):
+                    z = grid[key][:, :, shock_index]
+                    fig_heat = go.Figure(go.Heatmap(
+                        z=z,
+                        x=grid_terms,
+                        y=grid_rates,
+                        colorscale=colorscale,
+                        colorbar=dict(title=key.upper() if key == 'dscr' else 'đồng'),
+                        hovertemplate=f'Thời hạn: %{{x}} tháng<br>Lãi suất: %{{y:.2f}}%<br>{title}: {value_format}<extra></extra>'
+                    ))
+                    for level, color in thresholds:
+                        fig_heat.add_trace(go.Contour(
+                            z=z,
+                            x=grid_terms,
+                            y=grid_rates,
+                            contours=dict(start=level, end=level, size=1, coloring='lines', showlabels=True),
+                            line=dict(color=color, width=2),
+                            showscale=False,
+                            hoverinfo='skip'
+                        ))
+                    fig_heat.update_layout(
+                        title=title,
+                        xaxis_title='Thời hạn (tháng)',
+                        yaxis_title='Lãi suất (%/năm)',
+                        height=400
+                    )
+                    with column:
+                        st.plotly_chart(fig_heat, use_container_width=True)
+    
+            # Kiểm tra sức chịu đựng Monte Carlo
+            st.markdown("---")
+            with st.expander("🎲 Kiểm Tra Sức Chịu Đựng (Monte Carlo)", expanded=False):
+                col1, col2, col3, col4 = st.columns(4)
+                with col1:
+                    n_paths = st.selectbox("Số kịch bản", [1_000, 10_000, 100_000], index=1,
+                                           format_func=format_number)
+                with col2:
+                    income_volatility = st.number_input("Biến động thu nhập (%/năm)", min_value=0.0,
+                                                        value=10.0, step=1.0) / 100
+                with col3:
+                    rate_volatility = st.number_input("Biến động lãi suất (điểm %/năm)", min_value=0.0,
+                                                      value=1.0, step=0.1)
+                with col4:
+                    stress_seed = st.number_input("Seed", min_value=0, value=42, step=1)
+                
+                if st.button("▶️ Chạy Mô Phỏng", use_container_width=True, key="run_stress"):
+                    with st.spinner("Đang mô phỏng..."):
+                        st.session_state.stress_result = simulate_stress(
+                            st.session_state.financial_info,
+                            n_paths=n_paths,
+                            seed=int(stress_seed),
+                            chunk_size=5_000,
+                            income_volatility=income_volatility,
+                            project_volatility=income_volatility * 2.5,
+                            rate_volatility=rate_volatility
+                        )
+                
+                stress = st.session_state.get('stress_result')
+                if stress:
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("P(số dư âm)", f"{stress['prob_negative_surplus'] * 100:.1f}%")
+                    with col2:
+                        st.metric("P(DSCR < 1)", f"{stress['prob_dscr_below_1'] * 100:.1f}%")
+                    with col3:
+                        st.metric("P(vi phạm bất kỳ)", f"{stress['prob_any_breach'] * 100:.1f}%")
+                    
+                    if PLOTLY_AVAILABLE:
+                        import plotly.graph_objects as go
+                        
+                        bands = stress['dscr_bands']
+                        months = stress['months']
+                        labels = [f"P{p}" for p in stress['percentiles']]
+                        fig_fan = go.Figure()
+                        for lower, upper, opacity in ((0, -1, 0.15), (1, -2, 0.3)):
+                            fig_fan.add_trace(go.Scatter(
+                                x=months, y=bands[upper], line=dict(width=0),
+                                showlegend=False, hoverinfo='skip'
+                            ))
+                            fig_fan.add_trace(go.Scatter(
+                                x=months, y=bands[lower], fill='tonexty', line=dict(width=0),
+                                fillcolor=f'rgba(31, 119, 180, {opacity})',
+                                name=f'{labels[lower]}-{labels[upper]}'
+                            ))
+                        fig_fan.add_trace(go.Scatter(
+                            x=months, y=bands[len(bands) // 2], name='Trung vị',
+                            line=dict(color='#1f77b4')
+                        ))
+                        fig_fan.add_hline(y=1.0, line_dash='dash', line_color='#c0392b')
+                        fig_fan.update_layout(
+                            title=f"Dải Phân Vị DSCR ({format_number(stress['n_paths'])} kịch bản)",
+                            xaxis_title='Tháng',
+                            yaxis_title='DSCR',
+                            height=400
+                        )
+                        st.plotly_chart(fig_fan, use_container_width=True)
     
     # TAB 5: Lịch trả nợ
     with tabs[4]:
         st.subheader("📅 Lịch Trả Nợ Chi Tiết")
         
+        with st.expander("⚙️ Lãi suất thả nổi (ưu đãi + điều chỉnh định kỳ)"):
+            use_floating = st.checkbox("Áp dụng lãi suất thả nổi", key="use_floating_rate")
+            col1, col2 = st.columns(2)
+            with col1:
+                teaser_months = st.number_input("Thời gian ưu đãi (tháng)", min_value=0, value=12, step=1)
+                reset_every = st.selectbox("Chu kỳ điều chỉnh (tháng)", [3, 6])
+            with col2:
+                base_rate = st.number_input("Lãi suất cơ sở (%/năm)", min_value=0.0, value=6.0, step=0.1, format="%.2f")
+                margin = st.number_input("Biên độ (%/năm)", min_value=0.0, value=3.5, step=0.1, format="%.2f")
+            st.caption("Lãi suất ưu đãi = lãi suất trong tab Tài chính; sau ưu đãi = lãi suất cơ sở + biên độ")
+        
+        day_count = st.radio(
+            "Cách tính lãi:",
+            ["30/360 (theo tháng)", "Thực tế/365 (theo ngày)"],
+            horizontal=True
+        )
+        if day_count == "Thực tế/365 (theo ngày)":
+            col1, col2 = st.columns(2)
+            with col1:
+                disbursement_date = st.date_input("Ngày giải ngân", value=datetime.now().date(), format="DD/MM/YYYY")
+                payment_day = st.number_input("Ngày trả nợ hàng tháng", min_value=1, max_value=31,
+                                              value=disbursement_date.day, step=1)
+            with col2:
+                holiday_text = st.text_area(
+                    "Ngày nghỉ lễ bổ sung (dd/mm/yyyy)",
+                    help="Mỗi dòng một ngày, ví dụ các ngày nghỉ Tết âm lịch. Lễ dương lịch cố định đã được tính sẵn.",
+                    height=100
+                )
+            if use_floating:
+                st.info("💡 Lãi suất thả nổi chỉ áp dụng cho cách tính 30/360")
+        
         if st.button("📊 Tạo Lịch Trả Nợ", use_container_width=True):
             loan_amount = st.session_state.financial_info.get('loan_amount', 0)
             interest_rate = st.session_state.financial_info.get('interest_rate', 0)
             loan_term = st.session_state.financial_info.get('loan_term', 0)
             
             if loan_amount > 0 and loan_term > 0:
-                schedule = create_repayment_schedule(loan_amount, interest_rate, loan_term)
+                if day_count == "Thực tế/365 (theo ngày)":
+                    disbursed = np.datetime64(disbursement_date, 'D')
+                    year = disbursed.astype('datetime64[Y]').astype(int) + 1970
+                    holidays = np.union1d(
+                        fixed_holidays(year, year + int(loan_term) // 12 + 1),
+                        parse_holidays(holiday_text)
+                    )
+                    schedule = schedule_to_dataframe(actual365_schedule(
+                        loan_amount, interest_rate, loan_term, disbursement_date, payment_day, holidays
+                    ))
+                elif use_floating:
+                    rate_path = build_rate_path(loan_term, interest_rate, teaser_months, base_rate, margin, reset_every)
+                    schedule = schedule_to_dataframe(variable_rate_schedule(loan_amount, rate_path))
+                    schedule['Lãi suất (%/năm)'] = rate_path
+                else:
+                    schedule = create_repayment_schedule(loan_amount, interest_rate, loan_term)
                 st.session_state.repayment_schedule = schedule
                 st.success("✅ Đã tạo lịch trả nợ!")
             else:
@@ -996,6 +1025,8 @@ if st.session_state.data_extracted:
             st.dataframe(df, use_container_width=True, height=400)
             
             if PLOTLY_AVAILABLE:
+                import plotly.graph_objects as go
+                
                 st.markdown("### 📈 Biểu Đồ Trả Nợ")
                 
                 fig = go.Figure()
@@ -1022,6 +1053,78 @@ if st.session_state.data_extracted:
                 
                 st.plotly_chart(fig, use_container_width=True)
     
+        # Mô phỏng trả nợ trước hạn
+        loan_amount = st.session_state.financial_info.get('loan_amount', 0)
+        interest_rate = st.session_state.financial_info.get('interest_rate', 0)
+        loan_term = int(st.session_state.financial_info.get('loan_term', 0))
+        
+        if loan_amount > 0 and loan_term > 1:
+            st.markdown("---")
+            with st.expander("💸 Mô Phỏng Trả Nợ Trước Hạn", expanded=False):
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    prepay_month = st.slider("Trả trước sau kỳ", 1, loan_term - 1, min(24, loan_term - 1))
+                with col2:
+                    prepay_display = st.text_input(
+                        "Số tiền trả trước (đồng)",
+                        value=format_number_international(min(200_000_000, loan_amount)),
+                        key="prepay_amount_display"
+                    )
+                    prepay_amount = parse_number_international(prepay_display)
+                with col3:
+                    prepay_mode = st.radio(
+                        "Sau khi trả trước:",
+                        ["Giữ thời hạn, giảm tiền trả", "Giữ tiền trả, rút ngắn thời hạn"]
+                    )
+                
+                mode = KEEP_TERM if prepay_mode == "Giữ thời hạn, giảm tiền trả" else KEEP_PAYMENT
+                result = simulate_prepayments(
+                    loan_amount, interest_rate, loan_term,
+                    [(prepay_month, prepay_amount, mode)],
+                    disbursement_date=datetime.now().date()
+                )
+                
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Tiền lãi tiết kiệm", f"{format_number(result['interest_saved'])} đ")
+                with col2:
+                    st.metric(
+                        "Tất toán sau",
+                        f"{result['payoff_month']} tháng",
+                        delta=f"-{result['months_saved']} tháng" if result['months_saved'] else None
+                    )
+                with col3:
+                    st.metric("Trả hàng tháng mới", f"{format_number(result['final_payment'])} đ")
+                
+                if 'payoff_date' in result:
+                    st.caption(f"Ngày tất toán dự kiến (giải ngân hôm nay): "
+                               f"{to_date(result['payoff_date']).strftime('%d/%m/%Y')}")
+                
+                if PLOTLY_AVAILABLE:
+                    import plotly.graph_objects as go
+                    
+                    baseline = simulate_prepayments(loan_amount, interest_rate, loan_term, [])
+                    fig_prepay = go.Figure()
+                    fig_prepay.add_trace(go.Scatter(
+                        name='Không trả trước',
+                        y=segment_balances(baseline['segments'], interest_rate),
+                        x=list(range(1, loan_term + 1)),
+                        line=dict(color='#7f8c8d', dash='dash')
+                    ))
+                    fig_prepay.add_trace(go.Scatter(
+                        name='Có trả trước',
+                        y=segment_balances(result['segments'], interest_rate),
+                        x=list(range(1, result['payoff_month'] + 1)),
+                        line=dict(color='#1f77b4')
+                    ))
+                    fig_prepay.update_layout(
+                        title='Dư Nợ Cuối Kỳ',
+                        xaxis_title='Kỳ',
+                        yaxis_title='Số tiền (đồng)',
+                        height=350
+                    )
+                    st.plotly_chart(fig_prepay, use_container_width=True)
+    
     # TAB 6: Phân tích AI (Gộp File và Metrics)
     with tabs[5]:
         st.subheader("🤖 Phân Tích AI Gemini")
@@ -1031,6 +1134,22 @@ if st.session_state.data_extracted:
         elif not GENAI_AVAILABLE:
             st.error("⚠️ Thư viện google-generativeai chưa được cài đặt!")
         else:
+            # Chạy đồng thời hai phân tích trên luồng nền; có thể tiếp tục sửa dữ liệu trong lúc chờ
+            can_analyze_file = bool(st.session_state.uploaded_content)
+            can_analyze_metrics = 'metrics' in st.session_state
+            if st.button(
+                "⚡ Chạy Đồng Thời Cả Hai Phân Tích",
+                use_container_width=True,
+                key="analyze_both",
+                disabled=not (can_analyze_file or can_analyze_metrics)
+            ):
+                if can_analyze_file:
+                    submit_analysis("file", api_key, st.session_state.uploaded_content,
+                                    st.session_state.get('force_refresh_file', False))
+                if can_analyze_metrics:
+                    submit_analysis("metrics", api_key, build_metrics_content(),
+                                    st.session_state.get('force_refresh_metrics', False))
+            
             # Chọn loại phân tích
             analysis_type = st.radio(
                 "Chọn nguồn dữ liệu để phân tích:",
@@ -1038,21 +1157,46 @@ if st.session_state.data_extracted:
                 horizontal=True
             )
             
+            ai_cache = get_response_cache().stats()
+            st.caption(
+                f"🗄️ Cache phân tích AI: {ai_cache['memory_hits'] + ai_cache['disk_hits']} lần dùng lại, "
+                f"{ai_cache['entries']} câu trả lời trong bộ nhớ"
+            )
+            show_rate_limit()
+            if hedging_enabled():
+                for model_name, hedge in hedge_stats().items():
+                    threshold = f"{hedge['threshold_s']:.1f}s" if hedge['threshold_s'] is not None else "đang học"
+                    st.caption(
+                        f"🪁 Gọi dự phòng {model_name}: ngưỡng {threshold}, "
+                        f"{hedge['hedged']}/{hedge['requests']} lần gửi thêm, bản dự phòng thắng {hedge['hedge_wins']} lần"
+                    )
+            
             st.markdown("---")
             
             if analysis_type == "📄 Phân tích từ File gốc":
                 st.markdown("### 📄 Phân Tích File Gốc")
                 st.info("💡 Phân tích này dựa trên toàn bộ nội dung file PASDV bạn đã upload")
                 
-                if st.session_state.uploaded_content:
-                    if st.button("🔍 Phân Tích File Gốc", use_container_width=True, key="analyze_file"):
-                        with st.spinner("Đang phân tích file gốc..."):
-                            analysis = analyze_with_gemini(api_key, "file", st.session_state.uploaded_content)
-                            st.session_state.analysis_file = analysis
+                if can_analyze_file:
+                    plan = plan_document(st.session_state.uploaded_content)
+                    if plan['chunks']:
+                        st.caption(
+                            f"📑 File dài (~{plan['tokens']:,} token): sẽ phân tích {len(plan['chunks'])} phần "
+                            f"song song rồi tổng hợp; phần không đổi dùng lại kết quả cũ"
+                        )
+                    force_file = st.checkbox("🔄 Bỏ qua cache, gọi lại AI", key="force_refresh_file")
+                    if st.button("🔍 Phân Tích File Gốc", use_container_width=True, key="analyze_file",
+                                 disabled='file' in st.session_state.ai_jobs):
+                        submit_analysis("file", api_key, st.session_state.uploaded_content, force_file)
                     
-                    if 'analysis_file' in st.session_state:
+                    if st.session_state.ai_jobs:
+                        show_ai_jobs("file")
+                    if 'analysis_file' in st.session_state and 'file' not in st.session_state.ai_jobs:
                         st.markdown("#### 📋 Kết Quả Phân Tích:")
                         st.success("**✓ Nguồn dữ liệu:** File PASDV gốc đã upload")
+                        if st.session_state.get('analysis_file_cached_at'):
+                            cached_time = datetime.fromtimestamp(st.session_state.analysis_file_cached_at)
+                            st.caption(f"⚡ Kết quả lấy từ cache (phân tích lúc {cached_time.strftime('%H:%M %d/%m/%Y')})")
                         
                         # Hiển thị kết quả trong box
                         with st.container():
@@ -1068,42 +1212,20 @@ if st.session_state.data_extracted:
                 st.markdown("### 📊 Phân Tích Chỉ Số Tài Chính")
                 st.info("💡 Phân tích này dựa trên các chỉ số tài chính đã được tính toán")
                 
-                if 'metrics' in st.session_state:
-                    if st.button("🔍 Phân Tích Chỉ Số Tài Chính", use_container_width=True, key="analyze_metrics"):
-                        data_content = f"""
-THÔNG TIN KHÁCH HÀNG:
-- Tên: {st.session_state.customer_info.get('name', 'N/A')}
-- CCCD: {st.session_state.customer_info.get('cccd', 'N/A')}
-
-THÔNG TIN THU NHẬP:
-- Thu nhập hàng tháng: {format_number(st.session_state.financial_info.get('monthly_income', 0))} đồng
-- Chi phí hàng tháng: {format_number(st.session_state.financial_info.get('monthly_expense', 0))} đồng
-
-THÔNG TIN VAY VỐN:
-- Số tiền vay: {format_number(st.session_state.financial_info.get('loan_amount', 0))} đồng
-- Lãi suất: {st.session_state.financial_info.get('interest_rate', 0)}%/năm
-- Thời hạn: {st.session_state.financial_info.get('loan_term', 0)} tháng
-
-CÁC CHỈ TIÊU TÀI CHÍNH:
-- Trả nợ hàng tháng: {format_number(st.session_state.metrics.get('first_month_payment', 0))} đồng
-- Thu nhập ròng: {format_number(st.session_state.metrics.get('net_income', 0))} đồng
-- Tỷ lệ trả nợ/thu nhập: {st.session_state.metrics.get('debt_service_ratio', 0):.2f}%
-- DSCR: {st.session_state.metrics.get('dscr', 0):.2f}
-- Số dư sau trả nợ: {format_number(st.session_state.metrics.get('surplus', 0))} đồng
-- Tổng lãi phải trả: {format_number(st.session_state.metrics.get('total_interest', 0))} đồng
-
-TÀI SẢN ĐẢM BẢO:
-- Loại: {st.session_state.collateral_info.get('type', 'N/A')}
-- Giá trị: {format_number(st.session_state.collateral_info.get('value', 0))} đồng
-- LTV: {(st.session_state.financial_info.get('loan_amount', 0) / st.session_state.collateral_info.get('value', 1) * 100):.2f}%
-"""
-                        with st.spinner("Đang phân tích các chỉ số tài chính..."):
-                            analysis = analyze_with_gemini(api_key, "metrics", data_content)
-                            st.session_state.analysis_metrics = analysis
+                if can_analyze_metrics:
+                    force_metrics = st.checkbox("🔄 Bỏ qua cache, gọi lại AI", key="force_refresh_metrics")
+                    if st.button("🔍 Phân Tích Chỉ Số Tài Chính", use_container_width=True, key="analyze_metrics",
+                                 disabled='metrics' in st.session_state.ai_jobs):
+                        submit_analysis("metrics", api_key, build_metrics_content(), force_metrics)
                     
-                    if 'analysis_metrics' in st.session_state:
+                    if st.session_state.ai_jobs:
+                        show_ai_jobs("metrics")
+                    if 'analysis_metrics' in st.session_state and 'metrics' not in st.session_state.ai_jobs:
                         st.markdown("#### 📋 Kết Quả Phân Tích:")
                         st.success("**✓ Nguồn dữ liệu:** Các chỉ số tài chính đã tính toán")
+                        if st.session_state.get('analysis_metrics_cached_at'):
+                            cached_time = datetime.fromtimestamp(st.session_state.analysis_metrics_cached_at)
+                            st.caption(f"⚡ Kết quả lấy từ cache (phân tích lúc {cached_time.strftime('%H:%M %d/%m/%Y')})")
                         
                         # Hiển thị kết quả trong box
                         with st.container():
@@ -1124,6 +1246,7 @@ TÀI SẢN ĐẢM BẢO:
         elif not GENAI_AVAILABLE:
             st.error("⚠️ Thư viện google-generativeai chưa được cài đặt!")
         else:
+            show_rate_limit()
             chat_container = st.container()
             with chat_container:
                 for i, chat in enumerate(st.session_state.chat_history):
@@ -1151,24 +1274,23 @@ Thông tin khách hàng và dự án:
 - Lãi suất: {st.session_state.financial_info.get('interest_rate', 0)}%
 - Thu nhập: {format_number(st.session_state.financial_info.get('monthly_income', 0))} đồng/tháng
 """
+                        # Chỉ đưa vào prompt các đoạn của file PASDV liên quan tới câu hỏi
+                        passages = retrieve_passages(st.session_state.uploaded_content, user_input)
+                        if passages:
+                            context += "\nTrích đoạn liên quan từ file PASDV:\n" + "\n".join(f"- {p}" for p in passages) + "\n"
+                        
+                        # Hiển thị câu hỏi và câu trả lời đang stream ngay dưới lịch sử chat
+                        with chat_container:
+                            st.markdown(f"**👤 Bạn:** {user_input}")
+                            st.markdown("---")
+                            stream_box = st.empty()
                         
                         with st.spinner("AI đang suy nghĩ..."):
                             try:
-                                current_time = time.time()
-                                time_since_last = current_time - st.session_state.last_request_time
-                                if time_since_last < 2:
-                                    time.sleep(2 - time_since_last)
-                                
-                                configure_gemini(api_key)
-                                
-                                def chat_request():
-                                    model = genai.GenerativeModel('gemini-2.0-flash')
-                                    prompt = f"{context}\n\nCâu hỏi: {user_input}"
-                                    response = model.generate_content(prompt)
-                                    st.session_state.last_request_time = time.time()
-                                    return response.text
-                                
-                                ai_response = retry_with_backoff(chat_request)
+                                ai_response = chat_with_gemini(
+                                    api_key, context, user_input,
+                                    on_text=lambda text: stream_box.markdown(f"**🤖 AI:** {text} ▌")
+                                )
                                 
                                 st.session_state.chat_history.append({
                                     'role': 'assistant',
@@ -0,0 +1 @@
+"""Lõi tính toán thẩm định - dùng chung cho Streamlit và các tác vụ không giao diện"""
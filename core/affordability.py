@@ -0,0 +1,107 @@
+"""Bài toán ngược: khoản vay tối đa, thời hạn ngắn nhất, lãi suất hòa vốn theo chính sách"""
+import math
+
+import numpy as np
+
+from core.amortization import annuity_payment
+from core.rules import rule_threshold
+
+# Ngưỡng chính sách mặc định lấy từ bộ quy tắc chấm điểm (mức "tốt")
+DEFAULT_POLICY = {
+    'min_dscr': rule_threshold('dscr'),
+    'max_dti': rule_threshold('dti'),
+    'max_ltv': rule_threshold('ltv'),
+}
+
+
+def max_affordable_payment(financial_info, policy=None):
+    """Khoản trả nợ hàng tháng tối đa thỏa cả DSCR tối thiểu và DTI tối đa"""
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    monthly_income = financial_info.get('monthly_income', 0)
+    monthly_expense = financial_info.get('monthly_expense', 0)
+    project_income = financial_info.get('project_income', 0)
+
+    net_income = monthly_income + project_income - monthly_expense
+    limits = {
+        'dscr': net_income / policy['min_dscr'] if policy['min_dscr'] > 0 else math.inf,
+        'dti': monthly_income * policy['max_dti'] / 100,
+    }
+    binding = min(limits, key=limits.get)
+    return max(limits[binding], 0.0), binding
+
+
+def present_value(payment, interest_rate, loan_term):
+    """Số tiền vay tương ứng với khoản trả đều `payment` (công thức niên kim ngược)"""
+    monthly_rate = (interest_rate / 100) / 12
+    if loan_term <= 0:
+        return 0.0
+    if monthly_rate > 0:
+        return payment * (1 - (1 + monthly_rate) ** -loan_term) / monthly_rate
+    return payment * loan_term
+
+
+def shortest_term(loan_amount, interest_rate, max_payment):
+    """Số tháng ngắn nhất để khoản trả không vượt `max_payment` (None nếu không khả thi)"""
+    monthly_rate = (interest_rate / 100) / 12
+    if loan_amount <= 0:
+        return 0
+    if max_payment <= 0:
+        return None
+    if monthly_rate > 0:
+        ratio = 1 - monthly_rate * loan_amount / max_payment
+        if ratio <= 0:
+            return None
+        term = -math.log(ratio) / math.log(1 + monthly_rate)
+    else:
+        term = loan_amount / max_payment
+    return max(1, math.ceil(term - 1e-9))
+
+
+def breakeven_rate(loan_amount, loan_term, max_payment, max_rate=100.0, iterations=60):
+    """Lãi suất %/năm cao nhất mà khoản trả vẫn không vượt `max_payment`.
+
+    Chia đôi vector hóa: các đầu vào có thể là mảng để giải nhiều hồ sơ cùng
+    lúc. Trả NaN khi ngay cả lãi suất 0% cũng không khả thi, và `max_rate` khi
+    mọi mức lãi suất đến `max_rate` đều khả thi.
+    """
+    loan_amount, loan_term, max_payment = np.broadcast_arrays(
+        np.asarray(loan_amount, dtype=float),
+        np.asarray(loan_term, dtype=float),
+        np.asarray(max_payment, dtype=float),
+    )
+    low = np.zeros(loan_amount.shape)
+    high = np.full(loan_amount.shape, float(max_rate))
+
+    for _ in range(iterations):
+        mid = (low + high) / 2
+        feasible = annuity_payment(loan_amount, mid, loan_term) <= max_payment
+        low = np.where(feasible, mid, low)
+        high = np.where(feasible, high, mid)
+
+    rate = np.where(annuity_payment(loan_amount, 0.0, loan_term) <= max_payment, low, np.nan)
+    rate = np.where(annuity_payment(loan_amount, max_rate, loan_term) <= max_payment, max_rate, rate)
+    return rate if rate.ndim else float(rate)
+
+
+def solve_affordability(financial_info, collateral_value=0, policy=None):
+    """Giải đồng thời khoản vay tối đa, thời hạn ngắn nhất và lãi suất hòa vốn"""
+    policy = {**DEFAULT_POLICY, **(policy or {})}
+    loan_amount = financial_info.get('loan_amount', 0)
+    interest_rate = financial_info.get('interest_rate', 0)
+    loan_term = financial_info.get('loan_term', 0)
+
+    max_payment, binding = max_affordable_payment(financial_info, policy)
+    max_loan = present_value(max_payment, interest_rate, loan_term)
+    if collateral_value > 0:
+        ltv_cap = collateral_value * policy['max_ltv'] / 100
+        if ltv_cap < max_loan:
+            max_loan, binding = ltv_cap, 'ltv'
+
+    return {
+        'max_payment': max_payment,
+        'max_loan_amount': max_loan,
+        'binding_constraint': binding,
+        'shortest_term': shortest_term(loan_amount, interest_rate, max_payment),
+        'breakeven_rate': breakeven_rate(loan_amount, loan_term, max_payment) if loan_term > 0 else None,
+        'current_payment': annuity_payment(loan_amount, interest_rate, loan_term) if loan_term > 0 else 0.0,
+    }
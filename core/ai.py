@@ -0,0 +1,326 @@
+"""Phân tích và hỏi đáp bằng Gemini
+
+google-generativeai rất nặng khi import nên chỉ được nạp ở lần gọi API đầu tiên
+(qua `core.gemini_client`).
+"""
+import importlib.util
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from core.cache import TieredTTLCache, content_hash
+from core.gemini_client import get_gemini_pool
+from core.hedge import HedgeCancelled, get_hedge_policy, hedging_enabled
+from core.ratelimit import OUTPUT_ALLOWANCE, estimate_tokens, get_gemini_limiter
+from core.retry import RetryPolicy, call_with_fallback
+
+
+def _module_available(name):
+    """Kiểm tra thư viện đã cài chưa mà không import nó"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+GENAI_AVAILABLE = _module_available('google.generativeai')
+
+MODEL_NAME = 'gemini-2.0-flash'
+# Chuỗi mô hình dự phòng khi mô hình chính hết thời gian / quá tải (ghi đè bằng GEMINI_MODELS)
+FALLBACK_MODELS = ['gemini-2.0-flash-lite']
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'pasdv', 'gemini_responses.sqlite3')
+
+# Nội dung hiển thị khi luồng trả lời bị ngắt giữa chừng và phải gọi lại từ đầu
+RETRY_NOTICE = "⏳ Kết nối bị gián đoạn, đang thử lại..."
+# Nội dung hiển thị khi chuyển sang mô hình dự phòng
+FALLBACK_NOTICE = "⏳ Mô hình chính chưa phản hồi, chuyển sang {model}..."
+# Nội dung hiển thị khi phải chờ lượt theo giới hạn tốc độ chung
+WAIT_NOTICE = "🚦 Đang chờ lượt gọi Gemini (khoảng {seconds:.0f}s)..."
+
+_response_cache = None
+
+PROMPTS = {
+    "file": """
+Bạn là chuyên gia thẩm định tín dụng ngân hàng. Hãy phân tích phương án kinh doanh sau và đưa ra đánh giá chi tiết:
+
+{content}
+
+Vui lòng phân tích theo các khía cạnh:
+1. Tính khả thi của dự án
+2. Khả năng tài chính của khách hàng
+3. Rủi ro tiềm ẩn
+4. Khuyến nghị cho ngân hàng (nên cho vay hay từ chối, điều kiện gì)
+""",
+    "metrics": """
+Bạn là chuyên gia thẩm định tín dụng. Dựa trên các chỉ số tài chính sau, hãy đánh giá khả năng trả nợ và rủi ro:
+
+{content}
+
+Hãy phân tích:
+1. Đánh giá các chỉ số tài chính (DSCR, DTI, LTV)
+2. Khả năng trả nợ
+3. Mức độ rủi ro
+4. Khuyến nghị cuối cùng
+""",
+    # Tổng hợp các tóm tắt từng phần của file dài (xem core.mapreduce)
+    "reduce": """
+Bạn là chuyên gia thẩm định tín dụng ngân hàng. Dưới đây là các phát hiện đã được tóm tắt từ từng phần của một phương án kinh doanh.
+Hãy tổng hợp và đưa ra đánh giá chi tiết:
+
+{content}
+
+Vui lòng phân tích theo các khía cạnh:
+1. Tính khả thi của dự án
+2. Khả năng tài chính của khách hàng
+3. Rủi ro tiềm ẩn
+4. Khuyến nghị cho ngân hàng (nên cho vay hay từ chối, điều kiện gì)
+""",
+}
+
+
+def gemini_models():
+    """Chuỗi mô hình theo thứ tự ưu tiên (GEMINI_MODELS, phân tách bằng dấu phẩy)"""
+    configured = os.environ.get('GEMINI_MODELS')
+    if configured:
+        return [name.strip() for name in configured.split(',') if name.strip()]
+    return [MODEL_NAME] + FALLBACK_MODELS
+
+def retry_policy():
+    """Chính sách thử lại cho Gemini (GEMINI_MAX_ATTEMPTS, GEMINI_TIMEOUT, GEMINI_DEADLINE)"""
+    return RetryPolicy(
+        max_attempts=int(os.environ.get('GEMINI_MAX_ATTEMPTS', 4)),
+        attempt_timeout=float(os.environ.get('GEMINI_TIMEOUT', 30)),
+        deadline=float(os.environ.get('GEMINI_DEADLINE', 90)),
+    )
+
+def _chunk_text(chunk):
+    """Phần văn bản của một đoạn trả về khi stream (đoạn cuối có thể không có text)"""
+    try:
+        return ''.join(getattr(part, 'text', '') for part in chunk.parts)
+    except (AttributeError, ValueError):
+        return ''
+
+class BlockedResponseError(RuntimeError):
+    """Gemini từ chối trả lời do bộ lọc an toàn (không thử lại)"""
+
+
+class EmptyResponseError(RuntimeError):
+    """Luồng trả lời kết thúc mà không có nội dung (lỗi tạm thời, được thử lại)"""
+
+
+def _block_reason(chunk):
+    """Lý do bị chặn của một đoạn trả về (None nếu không bị chặn)"""
+    try:
+        reason = getattr(getattr(chunk, 'prompt_feedback', None), 'block_reason', None)
+        if reason:
+            return getattr(reason, 'name', str(reason))
+        for candidate in getattr(chunk, 'candidates', None) or []:
+            finish = getattr(candidate, 'finish_reason', None)
+            name = getattr(finish, 'name', None)
+            if name in ('SAFETY', 'BLOCKLIST', 'PROHIBITED_CONTENT', 'SPII'):
+                return name
+    except (AttributeError, ValueError):
+        return None
+    return None
+
+def _stream_with_idle_timeout(start, idle_timeout, stop):
+    """Chạy `start()` (trả về iterator các đoạn) trên luồng riêng và sinh lần lượt từng đoạn.
+
+    Ném TimeoutError nếu chờ đoạn đầu tiên hoặc khoảng cách giữa hai đoạn vượt
+    `idle_timeout` giây; câu trả lời dài nhưng vẫn đều đặn không bị cắt. Khi
+    người gọi dừng giữa chừng, `stop` được bật để luồng đọc thôi nhận tiếp.
+    """
+    chunks = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in start():
+                if stop.is_set():
+                    return
+                chunks.put(('chunk', chunk))
+            chunks.put(('end', None))
+        except BaseException as e:
+            chunks.put(('error', e))
+
+    threading.Thread(target=produce, name='gemini-stream', daemon=True).start()
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=idle_timeout)
+            except queue.Empty:
+                raise TimeoutError(f"Gemini không phản hồi sau {idle_timeout:.0f}s") from None
+            if kind == 'end':
+                return
+            if kind == 'error':
+                raise value
+            yield value
+    finally:
+        stop.set()
+
+def streaming_request(api_key, prompt, on_text=None, model_name=MODEL_NAME, hedge=False):
+    """Tạo hàm `request(idle_timeout, remaining)` gọi Gemini ở chế độ stream cho `RetryPolicy`.
+
+    `idle_timeout` giới hạn thời gian chờ đoạn đầu tiên và giữa các đoạn;
+    `remaining` (thời gian tới hạn chót chung) là hạn gRPC của cả lời gọi.
+
+    `on_text` nhận toàn bộ văn bản đã nhận được sau mỗi đoạn. Mỗi lần thử lại
+    bắt đầu lại từ đầu: phần trả lời dở của lần trước được thay bằng
+    RETRY_NOTICE rồi ghi đè bởi văn bản mới, không bao giờ bị nối tiếp.
+    Mỗi lần gọi (kể cả thử lại và bản dự phòng khi `hedge`) phải xin lượt từ
+    bộ giới hạn tốc độ chung.
+    """
+    attempts = []
+    limiter = get_gemini_limiter()
+    reserved = estimate_tokens(prompt) + OUTPUT_ALLOWANCE
+    
+    def stream_once(idle_timeout, remaining, cancel, emit, admitted=None):
+        deadline_at = time.monotonic() + remaining if remaining else None
+        limiter.acquire(
+            reserved,
+            on_wait=lambda seconds: emit(WAIT_NOTICE.format(seconds=seconds)),
+            deadline_at=deadline_at,
+        )
+        if admitted is not None:
+            admitted()
+        used = reserved
+        stop = threading.Event()
+        try:
+            if deadline_at is not None:
+                # Thời gian chờ lượt đã tiêu vào hạn chót: tính lại phần còn lại cho lời gọi
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    used = 0
+                    raise TimeoutError("Hết thời gian cho phép của thao tác")
+                idle_timeout = min(idle_timeout, remaining) if idle_timeout else remaining
+            model = get_gemini_pool().model(api_key, model_name)
+            text = ''
+            request_options = {'timeout': remaining} if remaining else None
+            chunks = _stream_with_idle_timeout(
+                lambda: model.generate_content(prompt, stream=True, request_options=request_options),
+                idle_timeout,
+                stop,
+            )
+            for chunk in chunks:
+                if cancel is not None and cancel.is_set():
+                    raise HedgeCancelled()
+                reason = _block_reason(chunk)
+                if reason:
+                    raise BlockedResponseError(f"Nội dung bị bộ lọc an toàn chặn ({reason})")
+                usage = getattr(chunk, 'usage_metadata', None)
+                if getattr(usage, 'total_token_count', 0):
+                    used = usage.total_token_count
+                part = _chunk_text(chunk)
+                if part:
+                    text += part
+                    emit(text)
+        finally:
+            stop.set()
+            limiter.settle(reserved, used)
+        if not text:
+            raise EmptyResponseError("Gemini không trả về nội dung")
+        return text
+    
+    def request(idle_timeout=None, remaining=None):
+        if attempts and on_text:
+            on_text(RETRY_NOTICE)
+        attempts.append(time.time())
+        if hedge:
+            return get_hedge_policy(model_name).call(
+                lambda cancel, emit, admitted: stream_once(idle_timeout, remaining, cancel, emit, admitted),
+                on_text,
+            )
+        return stream_once(idle_timeout, remaining, None, on_text or (lambda text: None))
+    
+    return request
+
+def generate_text(api_key, prompt, on_text=None, hedge=False):
+    """Gọi Gemini theo chuỗi mô hình dự phòng với chính sách thử lại chung.
+
+    Trả về (văn bản, mô hình đã trả lời) để người gọi biết câu trả lời có đến
+    từ mô hình dự phòng hay không.
+    """
+    def on_fallback(model, error):
+        if on_text:
+            on_text(FALLBACK_NOTICE.format(model=model))
+    
+    return call_with_fallback(
+        lambda model: streaming_request(api_key, prompt, on_text, model, hedge),
+        gemini_models(),
+        retry_policy(),
+        on_fallback,
+        scope=content_hash(api_key),
+    )
+
+def is_primary_model(model):
+    """Mô hình là mô hình chính (chỉ câu trả lời của mô hình chính được lưu cache)"""
+    return model == gemini_models()[0]
+
+def build_prompt(analysis_type, content):
+    """Ghép nội dung vào mẫu prompt theo loại phân tích ("file", "metrics" hoặc "reduce")"""
+    template = PROMPTS.get(analysis_type, PROMPTS["metrics"])
+    return template.format(content=content)
+
+def normalize_prompt(prompt):
+    """Chuẩn hóa prompt trước khi băm: Unicode NFC và gộp mọi khoảng trắng"""
+    return ' '.join(unicodedata.normalize('NFC', prompt).split())
+
+def get_response_cache():
+    """Bộ đệm câu trả lời Gemini dùng chung trong tiến trình (tạo một lần).
+
+    Cấu hình qua GEMINI_CACHE_TTL (giây, mặc định 7 ngày), GEMINI_CACHE_SIZE
+    (số câu trả lời giữ trong bộ nhớ, mặc định 256) và GEMINI_CACHE_PATH (tệp
+    SQLite dùng chung giữa các phiên và lần khởi động; để trống để tắt).
+    """
+    global _response_cache
+    if _response_cache is None:
+        ttl = float(os.environ.get('GEMINI_CACHE_TTL', 7 * 24 * 3600))
+        size = int(os.environ.get('GEMINI_CACHE_SIZE', 256))
+        path = os.environ.get('GEMINI_CACHE_PATH', DEFAULT_CACHE_PATH) or None
+        try:
+            _response_cache = TieredTTLCache(ttl, size, path, disk_max_entries=size * 20)
+        except (OSError, sqlite3.Error):
+            # Không ghi được tệp cache (ổ chỉ đọc...) thì chỉ dùng bộ nhớ
+            _response_cache = TieredTTLCache(ttl, size)
+    return _response_cache
+
+# Hàm phân tích với Gemini
+def analyze_with_gemini(api_key, analysis_type, content, force_refresh=False, on_text=None):
+    """Phân tích dữ liệu bằng Gemini AI.
+
+    Trả về (nội dung, thời điểm lưu cache); thời điểm là None khi vừa gọi API.
+    Câu trả lời của mô hình dự phòng không được lưu cache.
+    `force_refresh` bỏ qua cache và ghi đè bằng câu trả lời mới; `on_text`
+    nhận văn bản từng phần trong lúc stream. Khi bật GEMINI_HEDGE, lời gọi
+    chậm hơn ngưỡng độ trễ học được sẽ có thêm một bản dự phòng chạy song song.
+    """
+    if not GENAI_AVAILABLE:
+        return "⚠️ Thư viện google-generativeai chưa được cài đặt!", None
+    
+    prompt = build_prompt(analysis_type, content)
+    cache = get_response_cache()
+    key = cache.key(gemini_models()[0], analysis_type, normalize_prompt(prompt))
+    if not force_refresh:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0], entry[1]
+    
+    try:
+        text, model = generate_text(api_key, prompt, on_text, hedge=hedging_enabled())
+        
+    except Exception as e:
+        return f"❌ Lỗi khi phân tích: {str(e)}\n\nVui lòng kiểm tra API key và kết nối internet.", None
+    
+    # Chỉ lưu câu trả lời thành công của mô hình chính: khóa cache theo mô hình chính nên
+    # câu trả lời của mô hình dự phòng sẽ bị phục vụ như của mô hình chính suốt TTL
+    if is_primary_model(model):
+        cache.put(key, text)
+    return text, None
+
+# Hàm hỏi đáp với Gemini
+def chat_with_gemini(api_key, context, question, on_text=None):
+    """Trả lời câu hỏi của người dùng dựa trên ngữ cảnh hồ sơ (lỗi được ném ra cho giao diện xử lý)"""
+    prompt = f"{context}\n\nCâu hỏi: {question}"
+    return generate_text(api_key, prompt, on_text)[0]
@@ -0,0 +1,211 @@
+"""Bộ máy tính lịch trả nợ vector hóa (NumPy) cho một hoặc nhiều khoản vay"""
+import numpy as np
+
+# Tên cột hiển thị của lịch trả nợ (giữ nguyên như giao diện cũ)
+SCHEDULE_COLUMNS = {
+    'period': 'Kỳ',
+    'payment_date': 'Ngày trả nợ',
+    'days': 'Số ngày',
+    'opening_balance': 'Dư nợ đầu kỳ',
+    'principal': 'Tiền gốc',
+    'interest': 'Tiền lãi',
+    'payment': 'Tổng trả',
+    'closing_balance': 'Dư nợ cuối kỳ',
+}
+
+
+def annuity_payment(loan_amount, interest_rate, loan_term):
+    """Số tiền trả đều hàng tháng (gốc + lãi), hỗ trợ cả scalar lẫn mảng"""
+    principal = np.asarray(loan_amount, dtype=float)
+    monthly_rate = np.asarray(interest_rate, dtype=float) / 100 / 12
+    term = np.asarray(loan_term, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        growth = (1 + monthly_rate) ** term
+        payment = np.where(
+            monthly_rate > 0,
+            principal * (monthly_rate * growth) / (growth - 1),
+            principal / term
+        )
+    payment = np.where(term > 0, payment, 0.0)
+    return payment if payment.ndim else float(payment)
+
+
+def amortization_schedule(loan_amount, interest_rate, loan_term):
+    """Tính lịch trả nợ dạng cột cho một khoản vay hoặc một mảng khoản vay.
+
+    Với đầu vào scalar trả về các mảng 1 chiều độ dài `loan_term`; với đầu vào
+    mảng trả về các mảng 2 chiều (số khoản vay × kỳ dài nhất), các kỳ vượt quá
+    thời hạn của từng khoản được điền 0. Kỳ cuối tất toán toàn bộ dư nợ còn lại
+    giống hệt cách hiệu chỉnh của vòng lặp cũ.
+    """
+    single = all(np.ndim(x) == 0 for x in (loan_amount, interest_rate, loan_term))
+
+    principal, rate, term = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(loan_amount, dtype=float)),
+        np.atleast_1d(np.asarray(interest_rate, dtype=float)),
+        np.atleast_1d(np.asarray(loan_term).astype(int)),
+    )
+    principal = principal[:, None]
+    monthly_rate = rate[:, None] / 100 / 12
+    term = term[:, None]
+
+    n_periods = int(term.max()) if term.size else 0
+    periods = np.arange(1, n_periods + 1)
+    active = periods <= term
+
+    payment = np.atleast_1d(annuity_payment(principal, rate[:, None], term))
+
+    # Dư nợ đầu kỳ k theo công thức đóng: P(1+r)^(k-1) - A((1+r)^(k-1) - 1)/r
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + monthly_rate) ** (periods - 1)
+        opening = np.where(
+            monthly_rate > 0,
+            principal * growth - payment * (growth - 1) / monthly_rate,
+            principal - payment * (periods - 1)
+        )
+    interest = opening * monthly_rate
+    principal_paid = payment - interest
+
+    # Kỳ cuối: trả toàn bộ dư nợ còn lại
+    last = periods == term
+    principal_paid = np.where(last, opening, principal_paid)
+    total_payment = np.where(last, opening + interest, np.broadcast_to(payment, opening.shape))
+    closing = opening - principal_paid
+
+    columns = {
+        'period': np.broadcast_to(periods, opening.shape).copy(),
+        'opening_balance': opening,
+        'principal': principal_paid,
+        'interest': interest,
+        'payment': total_payment,
+        'closing_balance': closing,
+    }
+    for key in columns:
+        if key != 'period':
+            columns[key] = np.where(active, columns[key], 0.0)
+    columns['period'] = np.where(active, columns['period'], 0)
+
+    if single:
+        columns = {key: value[0] for key, value in columns.items()}
+    return columns
+
+
+def _annuity_factor(monthly_rate, remaining):
+    """Hệ số trả đều: khoản trả kỳ này trên mỗi đồng dư nợ còn `remaining` kỳ"""
+    # (1+r)^-m tính qua exp/log1p: log1p chỉ chạy trên mảng lãi suất (nhỏ)
+    log_growth = np.log1p(monthly_rate)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = monthly_rate / -np.expm1(-remaining * log_growth)
+        factor = np.where(monthly_rate > 0, factor, 1 / remaining)
+    return np.where(remaining > 0, factor, 0.0)
+
+
+def build_rate_path(loan_term, teaser_rate, teaser_months, base_rate, margin, reset_every=3):
+    """Dựng đường lãi suất theo kỳ: ưu đãi cố định rồi thả nổi = lãi cơ sở + biên độ.
+
+    `base_rate` là scalar hoặc mảng (..., loan_term) lãi suất cơ sở theo từng kỳ
+    (ví dụ nhiều kịch bản lãi suất). Sau thời gian ưu đãi, lãi suất được điều
+    chỉnh mỗi `reset_every` tháng theo lãi cơ sở tại kỳ điều chỉnh và giữ
+    nguyên đến lần điều chỉnh kế tiếp. Kết quả có dạng (..., loan_term), %/năm.
+    """
+    loan_term = int(loan_term)
+    teaser_months = int(teaser_months)
+    reset_every = max(int(reset_every), 1)
+    periods = np.arange(1, loan_term + 1)
+    base = np.asarray(base_rate, dtype=float)
+    if base.ndim == 0:
+        base = np.full(loan_term, float(base))
+
+    # Kỳ điều chỉnh gần nhất (tính từ 1) đang áp dụng cho mỗi kỳ sau ưu đãi
+    floating = periods > teaser_months
+    reset_period = teaser_months + ((periods - teaser_months - 1) // reset_every) * reset_every + 1
+    reset_period = np.where(floating, reset_period, 1)
+    floating_rate = np.take(base, reset_period - 1, axis=-1) + margin
+    return np.where(floating, floating_rate, float(teaser_rate))
+
+
+def variable_rate_schedule(loan_amount, rate_path, loan_term=None):
+    """Lịch trả nợ lãi suất thả nổi, tái phân bổ dư nợ còn lại mỗi khi lãi suất đổi.
+
+    `rate_path` là mảng lãi suất %/năm dạng (..., số kỳ), có thể mang thêm các
+    trục kịch bản và khoản vay phía trước; `loan_amount` và `loan_term` được
+    broadcast theo các trục đó. Mỗi kỳ khoản trả bằng dư nợ đầu kỳ nhân hệ số
+    trả đều theo lãi suất và số kỳ còn lại, nên dư nợ là tích lũy của các hệ số
+    và toàn bộ lịch được tính bằng một lần cumprod, không vòng lặp Python.
+    """
+    rates = np.asarray(rate_path, dtype=float)
+    n_periods = rates.shape[-1]
+    if loan_term is None:
+        loan_term = n_periods
+    principal = np.asarray(loan_amount, dtype=float)[..., None]
+    term = np.asarray(loan_term).astype(int)[..., None]
+
+    periods = np.arange(1, n_periods + 1)
+    monthly_rate = rates / 100 / 12
+    remaining = term - periods + 1
+    active = remaining > 0
+
+    factor = _annuity_factor(monthly_rate, remaining)
+    growth = 1 + monthly_rate - factor
+    growth[..., -1] = 1.0
+    growth = np.roll(growth, 1, axis=-1)
+    # Sau kỳ cuối hệ số tăng trưởng bằng 0 nên dư nợ tự về 0, không cần mặt nạ
+    opening = np.cumprod(growth, axis=-1) * (principal * (term > 0))
+
+    interest = opening * monthly_rate
+    payment = opening * factor
+
+    # Kỳ cuối: trả toàn bộ dư nợ còn lại
+    last = remaining == 1
+    principal_paid = np.where(last, opening, payment - interest)
+    payment = np.where(last, opening + interest, payment)
+    closing = opening - principal_paid
+
+    return {
+        'period': np.broadcast_to(np.where(active, periods, 0), opening.shape).copy(),
+        'opening_balance': opening,
+        'principal': principal_paid,
+        'interest': interest,
+        'payment': payment,
+        'closing_balance': closing,
+    }
+
+
+def variable_rate_payments(loan_amount, rate_path):
+    """Chỉ tính khoản trả từng kỳ của `variable_rate_schedule` (ít bộ nhớ hơn)"""
+    monthly_rate = np.asarray(rate_path, dtype=float) / 100 / 12
+    n_periods = monthly_rate.shape[-1]
+    remaining = n_periods - np.arange(n_periods)
+
+    factor = _annuity_factor(monthly_rate, remaining)
+    growth = 1 + monthly_rate - factor
+    growth[..., -1] = 1.0
+    opening = np.cumprod(np.roll(growth, 1, axis=-1), axis=-1)
+    opening *= factor
+    return opening * np.asarray(loan_amount, dtype=float)[..., None]
+
+
+def schedule_to_dataframe(columns):
+    """Chuyển kết quả `amortization_schedule` thành DataFrame với tên cột tiếng Việt.
+
+    Kết quả nhiều khoản vay được trải thành dạng dài, thêm cột 'Khoản vay'
+    (chỉ số khoản vay) và bỏ các kỳ không hoạt động.
+    """
+    import pandas as pd
+
+    if np.ndim(columns['period']) == 1:
+        return pd.DataFrame({SCHEDULE_COLUMNS[key]: value for key, value in columns.items()})
+
+    active = columns['period'] > 0
+    loan_index = np.nonzero(active)[0]
+    data = {'Khoản vay': loan_index}
+    for key, value in columns.items():
+        data[SCHEDULE_COLUMNS[key]] = value[active]
+    return pd.DataFrame(data)
+
+
+# Hàm tạo lịch trả nợ
+def create_repayment_schedule(loan_amount, interest_rate, loan_term):
+    """Tạo lịch trả nợ chi tiết"""
+    return schedule_to_dataframe(amortization_schedule(loan_amount, interest_rate, int(loan_term)))
@@ -0,0 +1,169 @@
+"""Thẩm định hàng loạt không giao diện: quét thư mục file PASDV và chạy song song nhiều tiến trình
+
+Ví dụ:
+    python -m core.batch ho_so/ "luu_tru/**/*.docx" -o ket_qua.csv --workers 8
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from core.amortization import create_repayment_schedule
+from core.extraction import extract_document
+from core.metrics import calculate_financial_metrics
+from core.rules import evaluate_rules
+
+
+def collect_files(inputs, recursive=True):
+    """Danh sách file .docx từ các thư mục/mẫu glob đầu vào (bỏ file tạm ~$ của Word)"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*.docx') if recursive else os.path.join(item, '*.docx')
+            paths.extend(glob.glob(pattern, recursive=recursive))
+        else:
+            paths.extend(glob.glob(item, recursive=True))
+    return sorted({
+        os.path.abspath(path) for path in paths
+        if path.lower().endswith('.docx') and not os.path.basename(path).startswith('~$')
+    })
+
+
+def schedule_path(path, schedules_dir, root):
+    """Đường dẫn CSV lịch trả nợ: giữ cấu trúc thư mục tương đối so với `root` để file trùng tên không ghi đè nhau"""
+    relative = os.path.relpath(os.path.splitext(path)[0], root)
+    return os.path.join(schedules_dir, f'{relative}_lich_tra_no.csv')
+
+
+def input_root(paths):
+    """Thư mục gốc chung của các file đầu vào"""
+    if len(paths) == 1:
+        return os.path.dirname(paths[0])
+    return os.path.commonpath(paths)
+
+
+def appraise_file(path, schedules_dir=None, root=None):
+    """Thẩm định một file: trích xuất, tính chỉ tiêu, lập lịch trả nợ; lỗi được trả về thay vì ném ra"""
+    try:
+        with open(path, 'rb') as f:
+            result = extract_document(f.read())
+        financial_info = result['financial']
+        metrics = calculate_financial_metrics(financial_info)
+
+        row = {'file': path}
+        row.update({f'customer_{key}': value for key, value in result['customer'].items()})
+        row.update(financial_info)
+        row.update({f'collateral_{key}': value for key, value in result['collateral'].items()})
+        row.update(metrics)
+
+        loan_amount = financial_info.get('loan_amount', 0)
+        loan_term = financial_info.get('loan_term', 0)
+        if loan_amount > 0 and loan_term > 0:
+            schedule = create_repayment_schedule(loan_amount, financial_info.get('interest_rate', 0), loan_term)
+            row['schedule_periods'] = len(schedule)
+            row['schedule_total_interest'] = float(schedule['Tiền lãi'].sum())
+            if schedules_dir:
+                target = schedule_path(path, schedules_dir, root or os.path.dirname(path))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                schedule.to_csv(target, index=False)
+        return row
+    except Exception as e:
+        return {'file': path, 'error': f'{type(e).__name__}: {e}'}
+
+
+def _appraise_chunk(args):
+    """Chạy một khối file trong tiến trình con (giảm chi phí gửi nhận giữa các tiến trình)"""
+    paths, schedules_dir, root = args
+    return [appraise_file(path, schedules_dir, root) for path in paths]
+
+
+def run_batch(paths, workers=None, chunksize=8, schedules_dir=None):
+    """Thẩm định danh sách file bằng ProcessPoolExecutor; trả về (DataFrame kết quả, danh sách lỗi)"""
+    if schedules_dir:
+        os.makedirs(schedules_dir, exist_ok=True)
+    root = input_root(paths) if paths else None
+    chunks = [(paths[i:i + chunksize], schedules_dir, root) for i in range(0, len(paths), chunksize)]
+
+    rows = []
+    errors = []
+    if workers == 1:
+        for chunk in map(_appraise_chunk, chunks):
+            rows.extend(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk in executor.map(_appraise_chunk, chunks):
+                rows.extend(chunk)
+
+    results = []
+    for row in rows:
+        (errors if 'error' in row else results).append(row)
+
+    frame = pd.DataFrame(results)
+    if not frame.empty:
+        # Chấm điểm cả lô trong một lần đánh giá vector hóa
+        scoring = pd.DataFrame({
+            'loan_amount': frame.get('loan_amount', 0),
+            'collateral_value': frame.get('collateral_value', 0),
+            'dscr': frame.get('dscr', 0),
+            'debt_service_ratio': frame.get('debt_service_ratio', 0),
+        }, index=frame.index).fillna(0)
+        grading = evaluate_rules(scoring)
+        frame = frame.join(grading.drop(columns=[c for c in grading.columns if c in frame.columns]))
+    return frame, errors
+
+
+def write_results(frame, output):
+    """Ghi kết quả hợp nhất ra CSV hoặc JSONL (theo phần mở rộng của file)"""
+    if output.lower().endswith(('.jsonl', '.ndjson')):
+        frame.to_json(output, orient='records', lines=True, force_ascii=False)
+    else:
+        frame.to_csv(output, index=False, encoding='utf-8-sig')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Thẩm định hàng loạt file PASDV (.docx)')
+    parser.add_argument('inputs', nargs='+', help='Thư mục hoặc mẫu glob chứa file .docx')
+    parser.add_argument('-o', '--output', default='ket_qua_tham_dinh.csv',
+                        help='File kết quả hợp nhất (.csv hoặc .jsonl)')
+    parser.add_argument('--errors', help='File ghi lỗi từng file (JSONL, mặc định <output>.errors.jsonl)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Số tiến trình song song')
+    parser.add_argument('--chunksize', type=int, default=8, help='Số file mỗi lần giao cho một tiến trình')
+    parser.add_argument('--schedules-dir', help='Thư mục ghi lịch trả nợ CSV cho từng file')
+    parser.add_argument('--no-recursive', action='store_true', help='Không quét thư mục con')
+    args = parser.parse_args(argv)
+
+    paths = collect_files(args.inputs, recursive=not args.no_recursive)
+    if not paths:
+        print('Không tìm thấy file .docx nào.', file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    frame, errors = run_batch(paths, args.workers, max(1, args.chunksize), args.schedules_dir)
+    elapsed = time.perf_counter() - started
+
+    write_results(frame, args.output)
+    errors_path = args.errors or f'{os.path.splitext(args.output)[0]}.errors.jsonl'
+    if errors:
+        with open(errors_path, 'w', encoding='utf-8') as f:
+            for error in errors:
+                f.write(json.dumps(error, ensure_ascii=False) + '\n')
+    elif os.path.exists(errors_path):
+        # Bỏ file lỗi của lần chạy trước để không bị hiểu nhầm là lỗi của lần này
+        os.remove(errors_path)
+
+    print(
+        f'{len(paths)} file trong {elapsed:.2f}s ({len(paths) / elapsed:.1f} file/s), '
+        f'{len(frame)} thành công, {len(errors)} lỗi -> {args.output}'
+        + (f' (lỗi: {errors_path})' if errors else ''),
+        file=sys.stderr
+    )
+    return 0 if not errors else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
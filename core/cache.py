@@ -0,0 +1,249 @@
+"""Bộ nhớ đệm LRU trong tiến trình kèm tầng lưu đĩa tùy chọn"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """Băm SHA-256 nội dung (bytes hoặc str)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """LRU giới hạn số phần tử, an toàn luồng, có bộ đếm hit/miss"""
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class JSONDiskCache:
+    """Tầng đĩa: mỗi phần tử một tệp JSON trong thư mục con theo phiên bản.
+
+    Cache chỉ dùng thư mục riêng `<directory>/<namespace>` và đặt tên thư mục
+    phiên bản với tiền tố `VERSION_PREFIX`. Khi khởi tạo, chỉ các thư mục mang
+    tiền tố đó của phiên bản khác bị xóa, nên dữ liệu cũ tự vô hiệu khi phiên
+    bản (ví dụ mẫu trích xuất) thay đổi mà không đụng tới dữ liệu khác khi
+    `directory` là thư mục dùng chung (ví dụ ~/.cache).
+    """
+
+    VERSION_PREFIX = 'v-'
+
+    def __init__(self, directory, version, namespace='pasdv_extraction'):
+        root = os.path.join(directory, namespace)
+        current = self.VERSION_PREFIX + version
+        self.directory = os.path.join(root, current)
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name != current and name.startswith(self.VERSION_PREFIX) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, payload):
+        path = self._path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+
+
+class TieredJSONCache:
+    """Bộ đệm hai tầng cho kết quả dạng JSON: LRU trong bộ nhớ rồi đến đĩa.
+
+    Giá trị được lưu dạng chuỗi JSON và giải mã mỗi lần đọc, nên người gọi
+    luôn nhận bản sao độc lập và có thể sửa tự do mà không làm hỏng bộ đệm.
+    """
+
+    def __init__(self, version, max_entries=128, directory=None):
+        self.version = version
+        self.memory = LRUCache(max_entries)
+        self.disk = JSONDiskCache(directory, version) if directory else None
+        self.disk_hits = 0
+
+    def key(self, data):
+        return content_hash(data)
+
+    def get(self, key):
+        payload = self.memory.get(key)
+        if payload is None and self.disk is not None:
+            payload = self.disk.get(key)
+            if payload is not None:
+                self.disk_hits += 1
+                self.memory.put(key, payload)
+        return None if payload is None else json.loads(payload)
+
+    def __contains__(self, key):
+        """Có mục `key` ở tầng bộ nhớ hoặc tầng đĩa (không giải mã, không tính vào thống kê)"""
+        return key in self.memory or (self.disk is not None and key in self.disk)
+
+    def put(self, key, value):
+        payload = json.dumps(value, ensure_ascii=False)
+        self.memory.put(key, payload)
+        if self.disk is not None:
+            self.disk.put(key, payload)
+
+    def stats(self):
+        """Số lần trúng (bộ nhớ, đĩa) và trượt"""
+        misses = self.memory.misses - self.disk_hits
+        return {
+            'memory_hits': self.memory.hits,
+            'disk_hits': self.disk_hits,
+            'misses': misses,
+            'entries': len(self.memory),
+        }
+
+
+class SQLiteCache:
+    """Tầng đĩa SQLite có TTL và giới hạn số dòng (xóa mục lâu không dùng nhất).
+
+    Một tệp dùng chung được cho mọi phiên, mọi tiến trình và qua các lần khởi
+    động lại; mỗi dòng lưu chuỗi JSON kèm thời điểm tạo và lần đọc gần nhất.
+    """
+
+    def __init__(self, path, ttl=None, max_entries=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+
+    def get(self, key):
+        """Trả về (payload, thời điểm tạo) hoặc None nếu không có / đã hết hạn"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT payload, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                return None
+            self._conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return row
+
+    def put(self, key, payload, created=None):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries (key, payload, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, payload, created or now, now)
+            )
+            if self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM entries WHERE key IN '
+                    '(SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                    (self.max_entries,)
+                )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+
+class TieredTTLCache:
+    """Bộ đệm hai tầng có hạn dùng: LRU trong bộ nhớ rồi đến SQLite.
+
+    Giống `TieredJSONCache` nhưng mỗi mục hết hạn sau `ttl` giây kể từ lúc tạo
+    (ở cả hai tầng) và khóa được băm từ nhiều thành phần.
+    """
+
+    def __init__(self, ttl=None, max_entries=256, path=None, disk_max_entries=None):
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries)
+        self.disk = SQLiteCache(path, ttl, disk_max_entries) if path else None
+        self.disk_hits = 0
+        self.expired = 0
+
+    def key(self, *parts):
+        return content_hash('\x00'.join(str(part) for part in parts))
+
+    def _fresh(self, created):
+        return self.ttl is None or time.time() - created <= self.ttl
+
+    def get(self, key):
+        """Trả về (giá trị, thời điểm tạo) hoặc None"""
+        entry = self.memory.get(key)
+        if entry is not None and not self._fresh(entry[1]):
+            self.expired += 1
+            entry = None
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self.memory.put(key, entry)
+        return None if entry is None else (json.loads(entry[0]), entry[1])
+
+    def put(self, key, value):
+        entry = (json.dumps(value, ensure_ascii=False), time.time())
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, *entry)
+
+    def stats(self):
+        """Số lần trúng (bộ nhớ, đĩa) và trượt"""
+        return {
+            'memory_hits': self.memory.hits - self.expired,
+            'disk_hits': self.disk_hits,
+            'misses': self.memory.misses + self.expired - self.disk_hits,
+            'entries': len(self.memory),
+        }
@@ -0,0 +1,98 @@
+"""Lịch trả nợ tính lãi theo ngày thực tế (Actual/365) từ ngày giải ngân"""
+from datetime import date, datetime
+
+import numpy as np
+
+# Ngày lễ dương lịch cố định (tháng, ngày); lễ âm lịch (Tết, Giỗ Tổ) nhập thêm theo từng năm
+FIXED_HOLIDAYS = [(1, 1), (4, 30), (5, 1), (9, 2)]
+
+
+def fixed_holidays(start_year, end_year):
+    """Danh sách ngày lễ dương lịch cố định trong khoảng năm, dạng datetime64[D]"""
+    years = np.arange(start_year, end_year + 1)
+    holidays = [
+        np.datetime64(f'{year:04d}-{month:02d}-{day:02d}')
+        for year in years for month, day in FIXED_HOLIDAYS
+    ]
+    return np.array(holidays, dtype='datetime64[D]')
+
+
+def parse_holidays(text):
+    """Đọc danh sách ngày nghỉ dạng dd/mm/yyyy (mỗi dòng hoặc phân cách bởi dấu phẩy)"""
+    holidays = []
+    for token in str(text).replace(',', '\n').split('\n'):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            holidays.append(datetime.strptime(token, '%d/%m/%Y').date())
+        except ValueError:
+            continue
+    return np.array(holidays, dtype='datetime64[D]')
+
+
+def payment_dates(disbursement_date, n_periods, payment_day, holidays=None):
+    """Dựng mảng ngày trả nợ hàng tháng, lùi sang ngày làm việc kế tiếp nếu trùng nghỉ.
+
+    Ngày trả nợ danh nghĩa là `payment_day` của các tháng sau tháng giải ngân
+    (cắt về ngày cuối tháng nếu tháng không đủ ngày), sau đó chuyển sang ngày
+    làm việc kế tiếp nếu rơi vào thứ Bảy, Chủ nhật hoặc ngày lễ.
+    """
+    disbursed = np.datetime64(disbursement_date, 'D')
+    months = disbursed.astype('datetime64[M]') + np.arange(1, n_periods + 1)
+    month_length = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(int)
+    day = np.minimum(int(payment_day), month_length)
+    scheduled = months.astype('datetime64[D]') + (day - 1)
+
+    if holidays is None:
+        year = disbursed.astype('datetime64[Y]').astype(int) + 1970
+        holidays = fixed_holidays(year, year + n_periods // 12 + 1)
+    return np.busday_offset(scheduled, 0, roll='forward', holidays=holidays)
+
+
+def actual365_schedule(loan_amount, interest_rate, loan_term, disbursement_date,
+                       payment_day, holidays=None):
+    """Lịch trả nợ trả đều, lãi tính theo số ngày thực tế/365 giữa các ngày trả nợ.
+
+    Khoản trả đều được giải chính xác để dư nợ về 0 sau kỳ cuối: với
+    g_k = 1 + lãi suất × số ngày_k / 365 và G_k = tích lũy g, khoản trả
+    A = P / Σ 1/G_k. Toàn bộ lịch tính bằng cumprod/cumsum trên mảng ngày.
+    """
+    loan_term = int(loan_term)
+    dates = payment_dates(disbursement_date, loan_term, payment_day, holidays)
+    previous = np.concatenate([[np.datetime64(disbursement_date, 'D')], dates[:-1]])
+    days = (dates - previous).astype(int)
+
+    period_rate = (interest_rate / 100) * days / 365
+    accumulated = np.cumprod(1 + period_rate)
+    discount = np.cumsum(1 / accumulated)
+    payment = loan_amount / discount[-1]
+
+    closing = accumulated * (loan_amount - payment * discount)
+    opening = np.concatenate([[loan_amount], closing[:-1]])
+    interest = opening * period_rate
+    principal = payment - interest
+    total_payment = np.full(loan_term, payment)
+
+    # Kỳ cuối: trả toàn bộ dư nợ còn lại
+    principal[-1] = opening[-1]
+    total_payment[-1] = opening[-1] + interest[-1]
+    closing = opening - principal
+
+    return {
+        'period': np.arange(1, loan_term + 1),
+        'payment_date': dates,
+        'days': days,
+        'opening_balance': opening,
+        'principal': principal,
+        'interest': interest,
+        'payment': total_payment,
+        'closing_balance': closing,
+    }
+
+
+def to_date(value):
+    """Chuyển datetime64/datetime về date (phục vụ hiển thị)"""
+    if isinstance(value, date):
+        return value
+    return np.datetime64(value, 'D').astype(date)
@@ -0,0 +1,112 @@
+"""Đọc nhanh văn bản .docx: duyệt trực tiếp word/document.xml, gồm cả nội dung bảng"""
+import zipfile
+from xml.etree import ElementTree
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+PARAGRAPH = W + 'p'
+TEXT = W + 't'
+TAB = W + 'tab'
+BREAKS = (W + 'br', W + 'cr')
+TABLE = W + 'tbl'
+ROW = W + 'tr'
+CELL = W + 'tc'
+TEXTBOX = W + 'txbxContent'
+DOCUMENT_PART = 'word/document.xml'
+
+# Tăng khi cách dựng văn bản thay đổi (làm mất hiệu lực bộ đệm trích xuất)
+READER_VERSION = 1
+
+
+class ReadCancelled(Exception):
+    """Việc đọc tài liệu bị hủy giữa chừng (ví dụ người dùng đã tải file khác)"""
+
+
+def _format_row(cells):
+    """Ghép các ô của một dòng bảng thành một dòng văn bản.
+
+    Dòng hai ô kiểu "nhãn | giá trị" được ghép thành "nhãn: giá trị" để các
+    mẫu trích xuất dạng "Nhãn: giá trị" áp dụng được cho bảng; các dòng khác
+    ghép bằng " | ".
+    """
+    cells = [cell for cell in cells if cell]
+    if len(cells) == 2:
+        label = cells[0].rstrip()
+        separator = ' ' if label.endswith(':') else ': '
+        return f'{label}{separator}{cells[1]}'
+    return ' | '.join(cells)
+
+
+def iter_document_lines(file, cancel=None):
+    """Sinh lần lượt từng đoạn văn và từng dòng bảng theo đúng thứ tự trong tài liệu.
+
+    Chỉ giải nén phần word/document.xml (không nạp ảnh, style...) và duyệt
+    bằng iterparse, giải phóng phần tử ngay khi xử lý xong nên bộ nhớ không
+    phụ thuộc kích thước tệp. Văn bản đoạn khớp với `Paragraph.text` của
+    python-docx (tab thành '\\t', ngắt dòng thành '\\n'). Nếu truyền `cancel`
+    (threading.Event), việc đọc dừng bằng `ReadCancelled` ngay khi sự kiện được đặt.
+    """
+    with zipfile.ZipFile(file) as archive, archive.open(DOCUMENT_PART) as part:
+        paragraphs = []   # chồng bộ đệm đoạn văn (đoạn lồng trong textbox)
+        tables = []       # chồng bảng: mỗi bảng là danh sách ô của dòng hiện tại
+        cells = []        # chồng ô: các dòng văn bản của ô hiện tại
+        textbox_depth = 0
+
+        for event, element in ElementTree.iterparse(part, events=('start', 'end')):
+            tag = element.tag
+            if event == 'start':
+                if tag == TEXTBOX:
+                    textbox_depth += 1
+                elif textbox_depth:
+                    continue
+                elif tag == PARAGRAPH:
+                    paragraphs.append([])
+                elif tag == TABLE:
+                    tables.append([])
+                elif tag == CELL:
+                    cells.append([])
+                continue
+
+            if tag == TEXTBOX:
+                textbox_depth -= 1
+                element.clear()
+                continue
+            if textbox_depth:
+                continue
+
+            if tag == TEXT:
+                if paragraphs:
+                    paragraphs[-1].append(element.text or '')
+            elif tag == TAB:
+                if paragraphs:
+                    paragraphs[-1].append('\t')
+            elif tag in BREAKS:
+                if paragraphs:
+                    paragraphs[-1].append('\n')
+            elif tag == PARAGRAPH:
+                if cancel is not None and cancel.is_set():
+                    raise ReadCancelled()
+                text = ''.join(paragraphs.pop())
+                element.clear()
+                if cells:
+                    cells[-1].append(text)
+                else:
+                    yield text
+            elif tag == CELL:
+                tables[-1].append('\n'.join(line for line in cells.pop() if line))
+                element.clear()
+            elif tag == ROW:
+                line = _format_row(tables[-1])
+                tables[-1] = []
+                element.clear()
+                if cells:
+                    cells[-1].append(line)
+                elif line:
+                    yield line
+            elif tag == TABLE:
+                tables.pop()
+                element.clear()
+
+
+def read_docx_text(file, cancel=None):
+    """Toàn bộ văn bản của tệp .docx (đoạn văn và bảng), mỗi đoạn/dòng bảng một dòng"""
+    return '\n'.join(iter_document_lines(file, cancel))
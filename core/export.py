@@ -0,0 +1,88 @@
+"""Xuất bảng trả nợ (Excel) và báo cáo thẩm định (Word)
+
+pandas và python-docx chỉ được import khi thực sự xuất để không làm chậm khởi động.
+"""
+import io
+from datetime import datetime
+
+from core.formatting import format_number
+
+
+# Hàm xuất Excel
+def export_to_excel(df):
+    """Xuất DataFrame sang Excel"""
+    import pandas as pd
+
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Lịch Trả Nợ')
+        
+        workbook = writer.book
+        worksheet = writer.sheets['Lịch Trả Nợ']
+        
+        for column in worksheet.columns:
+            max_length = 0
+            column = [cell for cell in column]
+            for cell in column:
+                try:
+                    if len(str(cell.value)) > max_length:
+                        max_length = len(cell.value)
+                except:
+                    pass
+            adjusted_width = (max_length + 2)
+            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
+    
+    return output.getvalue()
+
+# Hàm xuất báo cáo Word
+def export_appraisal_report(customer_info, financial_info, collateral_info, metrics, analysis_file="", analysis_metrics=""):
+    """Xuất báo cáo thẩm định sang Word"""
+    from docx import Document
+    
+    doc = Document()
+    
+    title = doc.add_heading('BÁO CÁO THẨM ĐỊNH PHƯƠNG ÁN KINH DOANH', 0)
+    title.alignment = 1
+    
+    doc.add_heading('I. THÔNG TIN KHÁCH HÀNG', 1)
+    doc.add_paragraph(f"Họ và tên: {customer_info.get('name', 'N/A')}")
+    doc.add_paragraph(f"CCCD: {customer_info.get('cccd', 'N/A')}")
+    doc.add_paragraph(f"Địa chỉ: {customer_info.get('address', 'N/A')}")
+    doc.add_paragraph(f"Điện thoại: {customer_info.get('phone', 'N/A')}")
+    doc.add_paragraph(f"Email: {customer_info.get('email', 'N/A')}")
+    
+    doc.add_heading('II. THÔNG TIN TÀI CHÍNH', 1)
+    doc.add_paragraph(f"Số tiền vay: {format_number(financial_info.get('loan_amount', 0))} đồng")
+    doc.add_paragraph(f"Lãi suất: {financial_info.get('interest_rate', 0)}%/năm")
+    doc.add_paragraph(f"Thời hạn: {financial_info.get('loan_term', 0)} tháng")
+    doc.add_paragraph(f"Mục đích vay: {financial_info.get('purpose', 'N/A')}")
+    doc.add_paragraph(f"Thu nhập hàng tháng: {format_number(financial_info.get('monthly_income', 0))} đồng")
+    doc.add_paragraph(f"Chi phí hàng tháng: {format_number(financial_info.get('monthly_expense', 0))} đồng")
+    
+    doc.add_heading('III. TÀI SẢN ĐẢM BẢO', 1)
+    doc.add_paragraph(f"Loại tài sản: {collateral_info.get('type', 'N/A')}")
+    doc.add_paragraph(f"Giá trị: {format_number(collateral_info.get('value', 0))} đồng")
+    doc.add_paragraph(f"Địa chỉ: {collateral_info.get('address', 'N/A')}")
+    
+    doc.add_heading('IV. CÁC CHỈ TIÊU TÀI CHÍNH', 1)
+    doc.add_paragraph(f"Trả nợ hàng tháng: {format_number(metrics.get('first_month_payment', 0))} đồng")
+    doc.add_paragraph(f"Thu nhập ròng: {format_number(metrics.get('net_income', 0))} đồng")
+    doc.add_paragraph(f"Tỷ lệ trả nợ/thu nhập: {metrics.get('debt_service_ratio', 0):.2f}%")
+    doc.add_paragraph(f"DSCR: {metrics.get('dscr', 0):.2f}")
+    doc.add_paragraph(f"Số dư sau trả nợ: {format_number(metrics.get('surplus', 0))} đồng")
+    doc.add_paragraph(f"Tổng lãi phải trả: {format_number(metrics.get('total_interest', 0))} đồng")
+    
+    if analysis_file or analysis_metrics:
+        doc.add_heading('V. PHÂN TÍCH AI', 1)
+        if analysis_file:
+            doc.add_heading('Phân tích từ file gốc:', 2)
+            doc.add_paragraph(analysis_file)
+        if analysis_metrics:
+            doc.add_heading('Phân tích từ các chỉ số tài chính:', 2)
+            doc.add_paragraph(analysis_metrics)
+    
+    doc.add_paragraph(f"\nNgày lập: {datetime.now().strftime('%d/%m/%Y')}")
+    
+    output = io.BytesIO()
+    doc.save(output)
+    return output.getvalue()
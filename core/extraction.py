@@ -0,0 +1,234 @@
+"""Trích xuất trường dữ liệu PASDV bằng bảng khai báo, quét văn bản một lượt"""
+import hashlib
+import io
+import os
+import re
+
+from core.cache import TieredJSONCache
+from core.docx_reader import READER_VERSION, read_docx_text
+from core.formatting import parse_number
+
+
+def _parse_text(value):
+    return value.strip()
+
+
+def _parse_rate(value):
+    return float(value.replace(',', '.'))
+
+
+# Bảng khai báo trường: mỗi biến thể là (nhãn neo, biểu thức, độ tin cậy), xếp theo ưu tiên.
+# Biểu thức phải bắt đầu đúng bằng nhãn neo để có thể so khớp tại vị trí neo.
+FIELD_TABLE = [
+    {'section': 'customer', 'key': 'name', 'label': 'Họ và tên', 'parse': _parse_text, 'variants': [
+        ('Họ và tên:', r'Họ và tên:\s*([^\n\r-]+)', 1.0),
+    ]},
+    {'section': 'customer', 'key': 'cccd', 'label': 'CCCD', 'parse': _parse_text, 'variants': [
+        ('CCCD', r'CCCD(?:/hộ chiếu)?:\s*(\d+)', 1.0),
+    ]},
+    {'section': 'customer', 'key': 'address', 'label': 'Địa chỉ', 'parse': _parse_text, 'variants': [
+        ('Nơi cư trú:', r'Nơi cư trú:\s*([^\n\r]+)', 1.0),
+    ]},
+    {'section': 'customer', 'key': 'phone', 'label': 'Số điện thoại', 'parse': _parse_text, 'variants': [
+        ('Số điện thoại:', r'Số điện thoại:\s*(\d+)', 1.0),
+    ]},
+    {'section': 'customer', 'key': 'email', 'label': 'Email', 'parse': _parse_text, 'variants': [
+        ('Email:', r'Email:\s*([^\s\n\r]+)', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'total_need', 'label': 'Tổng nhu cầu vốn', 'parse': parse_number, 'variants': [
+        ('Tổng nhu cầu vốn:', r'Tổng nhu cầu vốn:\s*([\d.,]+)\s*đồng', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'equity', 'label': 'Vốn đối ứng', 'parse': parse_number, 'variants': [
+        ('Vốn đối ứng', r'Vốn đối ứng[^:]*:\s*([\d.,]+)\s*đồng', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'loan_amount', 'label': 'Số tiền vay', 'parse': parse_number, 'variants': [
+        ('Vốn vay', r'Vốn vay[^:]*số tiền:\s*([\d.,]+)\s*đồng', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'interest_rate', 'label': 'Lãi suất', 'parse': _parse_rate, 'variants': [
+        ('Lãi suất:', r'Lãi suất:\s*([\d.,]+)%', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'loan_term', 'label': 'Thời hạn vay', 'parse': int, 'variants': [
+        ('Thời hạn vay:', r'Thời hạn vay:\s*(\d+)\s*tháng', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'purpose', 'label': 'Mục đích vay', 'parse': _parse_text, 'variants': [
+        ('Mục đích vay:', r'Mục đích vay:\s*([^\n\r]+)', 1.0),
+    ]},
+    {'section': 'financial', 'key': 'monthly_income', 'label': 'Thu nhập hàng tháng', 'parse': parse_number,
+     'variants': [
+         ('Tổng thu nhập', r'Tổng thu nhập[^:]*:\s*([\d.,]+)\s*đồng', 1.0),
+         ('Thu nhập', r'Thu nhập[^:]*:\s*([\d.,]+)\s*đồng/tháng', 0.7),
+     ]},
+    {'section': 'financial', 'key': 'monthly_expense', 'label': 'Chi phí hàng tháng', 'parse': parse_number,
+     'variants': [
+         ('Tổng chi phí hàng tháng:', r'Tổng chi phí hàng tháng:\s*([\d.,]+)', 1.0),
+     ]},
+    {'section': 'financial', 'key': 'project_income', 'label': 'Thu nhập từ kinh doanh', 'parse': parse_number,
+     'variants': [
+         ('Thu nhập', r'Thu nhập từ kinh doanh[^:]*:\s*([\d.,]+)\s*đồng/tháng', 1.0),
+     ]},
+    {'section': 'collateral', 'key': 'type', 'label': 'Loại tài sản', 'parse': _parse_text, 'variants': [
+        ('Tài sản ', r'Tài sản \d+:\s*([^\n\r.]+)', 1.0),
+    ]},
+    {'section': 'collateral', 'key': 'value', 'label': 'Giá trị tài sản', 'parse': parse_number, 'variants': [
+        ('Giá trị', r'Giá trị:\s*([\d.,]+)\s*đồng', 1.0),
+        ('Giá trị', r'Giá trị[^:]*:\s*([\d.,]+)\s*đồng', 0.7),
+    ]},
+    {'section': 'collateral', 'key': 'address', 'label': 'Địa chỉ tài sản', 'parse': _parse_text, 'variants': [
+        ('Địa chỉ:', r'Địa chỉ:\s*([^\n\r]+?)(?:Diện tích|Giấy|Tỷ lệ|\n|$)', 1.0),
+    ]},
+    {'section': 'collateral', 'key': 'area', 'label': 'Diện tích đất', 'parse': parse_number, 'variants': [
+        ('Diện tích đất:', r'Diện tích đất:\s*([\d.,]+)\s*m', 1.0),
+    ]},
+]
+
+def _compile_table(table):
+    """Biên dịch bảng trường một lần: danh sách biến thể (đã compile) theo từng nhãn neo"""
+    by_anchor = {}
+    for field_index, field in enumerate(table):
+        for priority, (anchor, pattern, confidence) in enumerate(field['variants']):
+            by_anchor.setdefault(anchor, []).append(
+                (field_index, priority, re.compile(pattern), confidence)
+            )
+    return by_anchor
+
+
+_VARIANTS_BY_ANCHOR = _compile_table(FIELD_TABLE)
+_ANCHOR_REGEX_CACHE = {}
+
+
+def _anchor_regex(anchors):
+    """Regex gộp các nhãn neo còn cần quét (cache theo tập neo)"""
+    regex = _ANCHOR_REGEX_CACHE.get(anchors)
+    if regex is None:
+        # Neo dài xếp trước để nhánh thay thế ưu tiên khớp dài nhất
+        ordered = sorted(anchors, key=len, reverse=True)
+        regex = re.compile('|'.join(re.escape(anchor) for anchor in ordered))
+        _ANCHOR_REGEX_CACHE[anchors] = regex
+    return regex
+
+
+_anchor_regex(frozenset(_VARIANTS_BY_ANCHOR))
+
+
+def extract_fields(full_text):
+    """Quét văn bản một lượt và phân giải toàn bộ trường trong bảng khai báo.
+
+    Regex neo gộp duyệt văn bản từ đầu đến cuối đúng một lần; tại mỗi vị trí
+    neo, các biến thể gắn với neo đó được so khớp cố định tại chỗ (`match`),
+    nên mỗi biến thể cho đúng kết quả khớp đầu tiên như `re.search` riêng lẻ
+    trước đây. Trường đã phân giải được bỏ khỏi tập neo cần quét, và việc quét
+    dừng ngay khi mọi trường đã có kết quả ưu tiên cao nhất. Trả về
+    (customer_info, financial_info, collateral_info, report) với report chứa
+    giá trị, vị trí và độ tin cậy từng trường.
+    """
+    # found[field_index][priority] = match đầu tiên của biến thể đó
+    found = [dict() for _ in FIELD_TABLE]
+    pending = {anchor: list(variants) for anchor, variants in _VARIANTS_BY_ANCHOR.items()}
+    regex = _anchor_regex(frozenset(pending))
+    position = 0
+
+    while pending:
+        anchor_match = regex.search(full_text, position)
+        if anchor_match is None:
+            break
+        resolved = []
+        for field_index, priority, variant_regex, _ in pending[anchor_match.group()]:
+            if priority in found[field_index]:
+                continue
+            match = variant_regex.match(full_text, anchor_match.start())
+            if match:
+                found[field_index][priority] = match
+                resolved.append((field_index, priority))
+
+        if resolved:
+            # Bỏ các biến thể không thể cải thiện kết quả nữa (ưu tiên thấp hơn hoặc bằng)
+            for field_index, priority in resolved:
+                for anchor in list(pending):
+                    pending[anchor] = [variant for variant in pending[anchor]
+                                       if variant[0] != field_index or variant[1] < priority]
+                    if not pending[anchor]:
+                        del pending[anchor]
+            if pending:
+                regex = _anchor_regex(frozenset(pending))
+        position = anchor_match.end()
+
+    sections = {'customer': {}, 'financial': {}, 'collateral': {}}
+    report = {}
+    for field, matches in zip(FIELD_TABLE, found):
+        if not matches:
+            continue
+        priority = min(matches)
+        match = matches[priority]
+        try:
+            value = field['parse'](match.group(1))
+        except ValueError:
+            continue
+        confidence = field['variants'][priority][2]
+        sections[field['section']][field['key']] = value
+        report[f"{field['section']}.{field['key']}"] = {
+            'label': field['label'],
+            'value': value,
+            'span': list(match.span(1)),
+            'variant': priority,
+            'confidence': confidence,
+        }
+
+    return sections['customer'], sections['financial'], sections['collateral'], report
+
+
+def _extractor_version():
+    """Phiên bản bộ trích xuất: băm bảng trường và phiên bản bộ đọc docx"""
+    signature = repr((READER_VERSION, [
+        (field['section'], field['key'], field['parse'].__name__, field['variants'])
+        for field in FIELD_TABLE
+    ]))
+    return hashlib.sha256(signature.encode('utf-8')).hexdigest()[:12]
+
+
+EXTRACTOR_VERSION = _extractor_version()
+
+_extraction_cache = None
+
+
+def get_extraction_cache():
+    """Bộ đệm trích xuất dùng chung trong tiến trình (tạo một lần).
+
+    Cấu hình qua biến môi trường EXTRACTION_CACHE_SIZE (số hồ sơ giữ trong bộ
+    nhớ, mặc định 128) và EXTRACTION_CACHE_DIR (bật tầng lưu đĩa).
+    """
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = TieredJSONCache(
+            EXTRACTOR_VERSION,
+            max_entries=int(os.environ.get('EXTRACTION_CACHE_SIZE', 128)),
+            directory=os.environ.get('EXTRACTION_CACHE_DIR') or None,
+        )
+    return _extraction_cache
+
+
+def extract_document(data, cancel=None):
+    """Đọc và trích xuất một tệp .docx (bytes) thành dict kết quả có thể tuần tự hóa JSON"""
+    text = read_docx_text(io.BytesIO(data), cancel)
+    customer_info, financial_info, collateral_info, report = extract_fields(text)
+    return {
+        'text': text,
+        'customer': customer_info,
+        'financial': financial_info,
+        'collateral': collateral_info,
+        'report': report,
+    }
+
+
+def extract_document_cached(data, cache=None):
+    """Như `extract_document` nhưng tra bộ đệm theo băm nội dung + phiên bản trước.
+
+    Trả về (kết quả, trúng_bộ_đệm).
+    """
+    cache = cache or get_extraction_cache()
+    key = cache.key(data)
+    result = cache.get(key)
+    if result is not None:
+        return result, True
+    result = extract_document(data)
+    cache.put(key, result)
+    return result, False
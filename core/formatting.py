@@ -0,0 +1,34 @@
+"""Định dạng và đọc số tiền theo kiểu Việt Nam / quốc tế"""
+
+
+# Hàm định dạng số
+def format_number(num):
+    """Định dạng số với dấu chấm phân cách hàng nghìn"""
+    try:
+        return "{:,.0f}".format(float(num)).replace(",", ".")
+    except:
+        return str(num)
+
+def format_number_international(num):
+    """Định dạng số theo chuẩn quốc tế (dấu phẩy phân cách hàng nghìn)"""
+    try:
+        return "{:,.0f}".format(float(num))
+    except:
+        return str(num)
+
+def parse_number(text):
+    """Chuyển đổi text thành số"""
+    try:
+        clean_text = str(text).replace(".", "").replace(",", ".")
+        return float(clean_text)
+    except:
+        return 0
+
+def parse_number_international(text):
+    """Chuyển đổi text theo chuẩn quốc tế thành số"""
+    try:
+        # Loại bỏ dấu phẩy (thousands separator)
+        clean_text = str(text).replace(",", "")
+        return float(clean_text)
+    except:
+        return 0
@@ -0,0 +1,105 @@
+"""Nhóm client/mô hình Gemini dùng lại theo (API key, tên mô hình)
+
+`genai.configure` ghi cấu hình toàn cục của tiến trình nên nhiều phiên dùng
+các API key khác nhau sẽ ghi đè lẫn nhau. Ở đây mỗi API key có một
+GenerativeServiceClient riêng (giữ kết nối gRPC để dùng lại) và mỗi cặp
+(key, mô hình) có một GenerativeModel tạo một lần, dùng chung an toàn giữa
+các luồng vì lời gọi không thay đổi trạng thái của đối tượng.
+"""
+import threading
+
+from core.cache import LRUCache, content_hash
+
+# Số API key khác nhau giữ client cùng lúc (client ít dùng nhất bị bỏ trước)
+MAX_CLIENTS = 32
+
+
+def _genai():
+    """Import google.generativeai ở lần dùng đầu tiên"""
+    import google.generativeai as genai
+    return genai
+
+class UnsupportedSDKError(RuntimeError):
+    """Phiên bản google-generativeai không còn thuộc tính client riêng của GenerativeModel"""
+
+
+def _create_client(api_key):
+    """Client gRPC riêng cho một API key, cùng user agent như client mặc định của SDK"""
+    from google.ai import generativelanguage as glm
+    from google.api_core import gapic_v1
+    from google.generativeai import client as genai_client
+
+    genai = _genai()
+    user_agent = f"{genai_client.USER_AGENT}/{genai.__version__}"
+    return glm.GenerativeServiceClient(
+        client_options={'api_key': api_key},
+        client_info=gapic_v1.client_info.ClientInfo(user_agent=user_agent),
+    )
+
+
+class GeminiClientPool:
+    """Client theo API key và GenerativeModel theo (API key, mô hình), tạo lười và dùng lại"""
+
+    def __init__(self, max_clients=MAX_CLIENTS):
+        # Khóa là băm của API key để key không xuất hiện trong thống kê / log
+        self._clients = LRUCache(max_clients)
+        self._models = LRUCache(max_clients * 4)
+        self._lock = threading.Lock()
+        self.created_clients = 0
+        self.created_models = 0
+
+    def client(self, api_key):
+        key = content_hash(api_key)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = _create_client(api_key)
+                    self._clients.put(key, client)
+                    self.created_clients += 1
+        return client
+
+    def model(self, api_key, model_name):
+        """GenerativeModel gắn với client của `api_key` (không dùng cấu hình toàn cục)"""
+        key = (content_hash(api_key), model_name)
+        model = self._models.get(key)
+        if model is None:
+            client = self.client(api_key)
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    model = _genai().GenerativeModel(model_name)
+                    # Thuộc tính nội bộ của google-generativeai 0.8.x (đã ghim trong requirements.txt);
+                    # thiếu thì báo lỗi thay vì âm thầm dùng client toàn cục của key khác
+                    if not hasattr(model, '_client'):
+                        raise UnsupportedSDKError(
+                            "google-generativeai không hỗ trợ gắn client riêng cho mô hình; "
+                            "hãy cài phiên bản trong requirements.txt (<0.9)"
+                        )
+                    model._client = client
+                    self._models.put(key, model)
+                    self.created_models += 1
+        return model
+
+    def stats(self):
+        return {
+            'clients': len(self._clients),
+            'models': len(self._models),
+            'created_clients': self.created_clients,
+            'created_models': self.created_models,
+            'model_hits': self._models.hits,
+        }
+
+
+_gemini_pool = None
+_gemini_pool_lock = threading.Lock()
+
+
+def get_gemini_pool():
+    """Nhóm client Gemini dùng chung trong tiến trình (tạo một lần)"""
+    global _gemini_pool
+    with _gemini_pool_lock:
+        if _gemini_pool is None:
+            _gemini_pool = GeminiClientPool()
+        return _gemini_pool
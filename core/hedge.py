@@ -0,0 +1,185 @@
+"""Yêu cầu dự phòng (hedged request) để cắt đuôi độ trễ của lời gọi API
+
+Nếu lời gọi chưa xong sau ngưỡng độ trễ (phân vị học từ các lần gọi gần đây),
+gửi thêm một lời gọi giống hệt; lời gọi nào xong trước thắng, lời gọi còn lại
+bị yêu cầu dừng và kết quả của nó bị bỏ qua. Số lời gọi thêm bị giới hạn theo
+tỷ lệ trên tổng số yêu cầu.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class HedgeCancelled(Exception):
+    """Lời gọi bị dừng vì lời gọi song song đã thắng"""
+
+
+class LatencyTracker:
+    """Độ trễ của các lần gọi gần đây, an toàn luồng"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        """Phân vị `q` (0-100) của độ trễ; None khi chưa đủ mẫu"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            samples = np.fromiter(self._samples, dtype=float)
+        return float(np.percentile(samples, q))
+
+
+class HedgePolicy:
+    """Ngưỡng gửi lời gọi dự phòng, giới hạn chi phí và thống kê thắng/thua.
+
+    `attempt(cancel, emit, admitted)` là một lần gọi: gọi `admitted()` khi được
+    bộ giới hạn tốc độ cho lượt, kiểm tra `cancel` (Event) giữa các đoạn stream
+    và gọi `emit(text)` với văn bản đã nhận. Ngưỡng gửi dự phòng và độ trễ ghi
+    nhận đều tính từ lúc được cho lượt: thời gian xếp hàng không phải độ trễ
+    của dịch vụ, và bản dự phòng gửi khi lời gọi chính còn xếp hàng chỉ xếp
+    sau nó. Mọi lần gọi `on_text` diễn ra trên luồng của người gọi (an toàn
+    với Streamlit); văn bản hiển thị theo lời gọi đầu tiên trả về nội dung.
+    """
+
+    def __init__(self, percentile=95, max_ratio=0.1, window=200, min_samples=20, max_workers=16):
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.tracker = LatencyTracker(window, min_samples)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+
+    def threshold(self):
+        """Số giây chờ trước khi gửi lời gọi dự phòng (None khi chưa học đủ)"""
+        return self.tracker.percentile(self.percentile)
+
+    def _allow_hedge(self):
+        with self._lock:
+            if self.hedged + 1 > self.max_ratio * self.requests:
+                return False
+            self.hedged += 1
+            return True
+
+    def _run(self, index, attempt, cancel, events):
+        def emit(text):
+            events.put(('text', index, text))
+
+        def admitted():
+            events.put(('admitted', index, time.monotonic()))
+        try:
+            events.put(('done', index, attempt(cancel, emit, admitted)))
+        except BaseException as e:
+            events.put(('error', index, e))
+
+    def call(self, attempt, on_text=None):
+        """Chạy `attempt`, gửi thêm một bản khi quá ngưỡng; trả về kết quả của bản xong trước"""
+        with self._lock:
+            self.requests += 1
+        threshold = self.threshold()
+        called = time.monotonic()
+        admitted_at = {}
+        events = queue.Queue()
+        cancels = [threading.Event()]
+        self._executor.submit(self._run, 0, attempt, cancels[0], events)
+
+        errors = {}
+        leader = None
+        try:
+            while True:
+                timeout = None
+                # Chỉ hẹn giờ gửi dự phòng khi lời gọi chính đã được cho lượt
+                if threshold is not None and len(cancels) == 1 and 0 in admitted_at:
+                    timeout = max(0.0, admitted_at[0] + threshold - time.monotonic())
+                try:
+                    kind, index, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    if self._allow_hedge():
+                        cancels.append(threading.Event())
+                        self._executor.submit(self._run, 1, attempt, cancels[1], events)
+                    else:
+                        threshold = None
+                    continue
+
+                if kind == 'admitted':
+                    admitted_at[index] = value
+                elif kind == 'text':
+                    if leader is None:
+                        leader = index
+                    if index == leader and on_text:
+                        on_text(value)
+                elif kind == 'done':
+                    self.tracker.record(time.monotonic() - admitted_at.get(index, called))
+                    with self._lock:
+                        if index == 0:
+                            self.primary_wins += 1
+                        else:
+                            self.hedge_wins += 1
+                    if index != leader and on_text:
+                        on_text(value)
+                    return value
+                else:
+                    errors[index] = value
+                    if leader == index:
+                        leader = None
+                    if len(errors) == len(cancels):
+                        # Thất bại cả hai: ném lỗi của lời gọi chính để lớp thử lại phân loại
+                        raise errors[0]
+        finally:
+            for cancel in cancels:
+                cancel.set()
+
+    def stats(self):
+        """Số yêu cầu, số lần gửi dự phòng, số lần bản dự phòng thắng và ngưỡng hiện tại"""
+        threshold = self.threshold()
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'primary_wins': self.primary_wins,
+                'hedge_rate': self.hedged / self.requests if self.requests else 0.0,
+                'threshold_s': threshold,
+            }
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def hedging_enabled():
+    """Bật chế độ gửi dự phòng qua GEMINI_HEDGE=1"""
+    return os.environ.get('GEMINI_HEDGE', '').lower() in ('1', 'true', 'yes', 'on')
+
+def get_hedge_policy(name):
+    """Chính sách dự phòng dùng chung theo tên (mỗi mô hình một phân bố độ trễ riêng).
+
+    Cấu hình qua GEMINI_HEDGE_PERCENTILE (mặc định 95) và GEMINI_HEDGE_MAX_RATIO
+    (tỷ lệ lời gọi thêm tối đa, mặc định 0.1).
+    """
+    with _policies_lock:
+        if name not in _policies:
+            _policies[name] = HedgePolicy(
+                percentile=float(os.environ.get('GEMINI_HEDGE_PERCENTILE', 95)),
+                max_ratio=float(os.environ.get('GEMINI_HEDGE_MAX_RATIO', 0.1)),
+            )
+        return _policies[name]
+
+def hedge_stats():
+    """Thống kê của mọi chính sách dự phòng theo tên"""
+    with _policies_lock:
+        policies = dict(_policies)
+    return {name: policy.stats() for name, policy in policies.items()}
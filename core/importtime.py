@@ -0,0 +1,102 @@
+"""Đo thời gian import của từng module lõi và kiểm tra ngân sách khởi động
+
+Mỗi module được import trong một tiến trình Python mới để không bị ảnh hưởng bởi bộ nhớ đệm module.
+Thoát với mã khác 0 nếu vượt ngân sách hoặc kéo theo thư viện nặng (streamlit, plotly, Gemini, python-docx, pandas).
+
+Ví dụ:
+    python -m core.importtime --budget-ms 250
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+MODULES = [
+    'core.affordability',
+    'core.ai',
+    'core.amortization',
+    'core.batch',
+    'core.cache',
+    'core.daycount',
+    'core.docx_reader',
+    'core.export',
+    'core.extraction',
+    'core.formatting',
+    'core.gemini_client',
+    'core.hedge',
+    'core.jobs',
+    'core.mapreduce',
+    'core.metrics',
+    'core.portfolio',
+    'core.prefetch',
+    'core.prepayment',
+    'core.ratelimit',
+    'core.retrieval',
+    'core.retry',
+    'core.rules',
+    'core.sensitivity',
+    'core.service',
+    'core.stress',
+]
+
+# Thư viện chỉ được nạp khi thực sự dùng tới
+LAZY_MODULES = ['streamlit', 'plotly', 'google.generativeai', 'docx', 'pandas']
+
+# Công cụ xử lý lô làm việc trực tiếp trên DataFrame: được nạp pandas ngay và có ngân sách riêng
+HEAVY_ALLOWED = {'core.batch': ['pandas'], 'core.portfolio': ['pandas']}
+HEAVY_BUDGET_MS = 700
+
+# Sát thời gian đo được của các module không cần pandas (~170 ms) để bắt được hồi quy
+DEFAULT_BUDGET_MS = 250
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+__import__({module!r})
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{'ms': elapsed, 'loaded': [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeat=3):
+    """Thời gian import (ms, lấy giá trị nhỏ nhất qua các lần chạy) và các thư viện nặng bị kéo theo"""
+    best, loaded = None, []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, lazy=LAZY_MODULES)],
+            capture_output=True, text=True, check=True,
+        )
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        best = result['ms'] if best is None else min(best, result['ms'])
+        loaded = result['loaded']
+    return best, loaded
+
+def check_budget(modules=None, budget_ms=DEFAULT_BUDGET_MS, repeat=3):
+    """Đo toàn bộ module; trả về (danh sách kết quả, đạt/không đạt)"""
+    rows, ok = [], True
+    for module in modules or MODULES:
+        ms, loaded = measure_import(module, repeat)
+        allowed = HEAVY_ALLOWED.get(module, [])
+        loaded = [name for name in loaded if name not in allowed]
+        passed = ms <= (HEAVY_BUDGET_MS if allowed else budget_ms) and not loaded
+        ok = ok and passed
+        rows.append({'module': module, 'ms': ms, 'heavy': loaded, 'pass': passed})
+    return rows, ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra ngân sách thời gian import của gói core")
+    parser.add_argument('modules', nargs='*', help="Module cần đo (mặc định: tất cả module lõi)")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help="Ngân sách cho mỗi module (ms)")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần đo mỗi module")
+    args = parser.parse_args(argv)
+    
+    rows, ok = check_budget(args.modules, args.budget_ms, args.repeat)
+    for row in rows:
+        status = "OK " if row['pass'] else "LỖI"
+        heavy = f"  (nạp sớm: {', '.join(row['heavy'])})" if row['heavy'] else ""
+        print(f"{status} {row['module']:<22} {row['ms']:8.1f} ms{heavy}", file=sys.stderr)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Chạy các tác vụ AI trên luồng nền để giao diện không bị chặn và kết quả không mất khi rerun"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Trạng thái tác vụ
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class AIJobRunner:
+    """Nhóm luồng chạy tác vụ theo id, giữ văn bản stream dở và kết quả cuối.
+
+    Tác vụ là hàm nhận tham số từ khóa `on_text`; văn bản từng phần được ghi
+    vào tác vụ để giao diện đọc lại ở lần rerun kế tiếp. Tác vụ đã xong được
+    giữ `keep_seconds` giây rồi bị dọn.
+    """
+
+    def __init__(self, max_workers=4, keep_seconds=3600):
+        self.keep_seconds = keep_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job_id, func, args, kwargs):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = JOB_RUNNING
+            job['started'] = time.time()
+
+        def on_text(text):
+            with self._lock:
+                job['text'] = text
+
+        try:
+            result = func(*args, on_text=on_text, **kwargs)
+        except Exception as e:
+            with self._lock:
+                job['status'] = JOB_FAILED
+                job['error'] = f'{type(e).__name__}: {e}'
+                job['finished'] = time.time()
+            return
+        with self._lock:
+            job['status'] = JOB_DONE
+            job['result'] = result
+            job['finished'] = time.time()
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_seconds
+        expired = [k for k, job in self._jobs.items() if job['finished'] is not None and job['finished'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, kind, func, *args, **kwargs):
+        """Đưa `func(*args, on_text=..., **kwargs)` vào hàng đợi; trả về id tác vụ"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                'id': job_id,
+                'kind': kind,
+                'status': JOB_QUEUED,
+                'text': '',
+                'result': None,
+                'error': None,
+                'submitted': time.time(),
+                'started': None,
+                'finished': None,
+            }
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def get(self, job_id):
+        """Bản sao trạng thái tác vụ (None nếu không tồn tại hoặc đã bị dọn)"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def active(self):
+        """Số tác vụ đang chờ hoặc đang chạy"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job['status'] in (JOB_QUEUED, JOB_RUNNING))
+
+
+_ai_job_runner = None
+_ai_job_lock = threading.Lock()
+
+
+def get_ai_job_runner():
+    """Bộ chạy tác vụ AI dùng chung trong tiến trình (số luồng qua AI_JOB_WORKERS, mặc định 4)"""
+    global _ai_job_runner
+    with _ai_job_lock:
+        if _ai_job_runner is None:
+            _ai_job_runner = AIJobRunner(max_workers=int(os.environ.get('AI_JOB_WORKERS', 4)))
+        return _ai_job_runner
@@ -0,0 +1,195 @@
+"""Phân tích file PASDV dài theo map-reduce trong giới hạn token
+
+File ngắn vẫn được phân tích trong một prompt như cũ. File dài được chia theo
+đề mục lớn (I., II., PHẦN...), các mục liền nhau được gộp thành phần gần đủ
+ngân sách token để giảm số lời gọi; mỗi phần được tóm tắt song song (map, có
+cache riêng theo nội dung phần) rồi các tóm tắt được tổng hợp thành đánh giá
+bốn mục (reduce). Sửa nội dung một mục thường chỉ làm phần chứa mục đó phải
+gọi lại (trừ khi độ dài thay đổi làm dịch ranh giới các phần phía sau).
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from core.ai import (
+    GENAI_AVAILABLE,
+    analyze_with_gemini,
+    generate_text,
+    gemini_models,
+    get_response_cache,
+    is_primary_model,
+    normalize_prompt,
+)
+from core.hedge import hedging_enabled
+from core.ratelimit import estimate_tokens
+
+MAP_PROMPT = """
+Bạn là chuyên gia thẩm định tín dụng ngân hàng. Dưới đây là phần "{title}" trích từ một phương án sử dụng vốn.
+Hãy tóm tắt ngắn gọn các thông tin và phát hiện quan trọng cho việc thẩm định: số liệu tài chính, nguồn trả nợ,
+tài sản bảo đảm, rủi ro và các điểm bất thường. Chỉ dựa vào nội dung được cung cấp, không suy đoán.
+
+{content}
+"""
+
+PROGRESS_NOTICE = "📑 Đã phân tích {done}/{total} phần của file..."
+# Độ dài tối đa của tiêu đề phần (ghép từ tiêu đề các mục) đưa vào prompt
+MAX_TITLE_CHARS = 300
+
+# Đề mục lớn: số La Mã, PHẦN/CHƯƠNG; đề mục con: 1., 2.1., 3)
+TOP_HEADING = re.compile(r'^\s*(?:[IVXLC]+\s*[.)]\s+\S|(?:PHẦN|CHƯƠNG|Phần|Chương)\s+[\wIVXLC]+)')
+SUB_HEADING = re.compile(r'^\s*\d+(?:\.\d+)*\s*[.)]\s+\S')
+
+
+def _is_caps_heading(line, previous):
+    """Dòng viết hoa toàn bộ, ngắn, đứng sau dòng trống (ví dụ tiêu đề 'PHƯƠNG ÁN SỬ DỤNG VỐN').
+
+    Bỏ qua dòng bảng ('|'), dòng 'nhãn: giá trị' và dòng viết hoa nằm liền
+    trong khối văn bản (tiêu đề thư, khối chữ ký, tiêu đề cột bảng).
+    """
+    if previous.strip() or '|' in line or ':' in line:
+        return False
+    letters = [c for c in line if c.isalpha()]
+    return 6 <= len(letters) and len(line) <= 120 and all(c.isupper() for c in letters)
+
+def split_sections(text):
+    """Chia văn bản theo đề mục lớn; trả về danh sách (tiêu đề, nội dung kể cả dòng tiêu đề)"""
+    sections = []
+    title, lines = "Phần mở đầu", []
+    previous = ''
+    for line in text.split('\n'):
+        is_heading = line.strip() and (TOP_HEADING.match(line) or _is_caps_heading(line.strip(), previous))
+        previous = line
+        if is_heading:
+            if any(l.strip() for l in lines):
+                sections.append((title, '\n'.join(lines).strip()))
+            title, lines = line.strip()[:80], []
+        lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((title, '\n'.join(lines).strip()))
+    return sections
+
+def _split_blocks(text):
+    """Chia một mục theo đề mục con (mỗi khối bắt đầu bằng một đề mục con)"""
+    blocks, lines = [], []
+    for line in text.split('\n'):
+        if SUB_HEADING.match(line) and lines:
+            blocks.append('\n'.join(lines))
+            lines = []
+        lines.append(line)
+    if lines:
+        blocks.append('\n'.join(lines))
+    return blocks
+
+def _pack(pieces, max_tokens, separator='\n', text=None):
+    """Gộp tham lam các mảnh liên tiếp thành các nhóm không vượt `max_tokens`; trả về danh sách nhóm.
+
+    `text(mảnh)` lấy văn bản của mảnh (mặc định mảnh chính là chuỗi).
+    """
+    text = text or (lambda piece: piece)
+    groups, current = [], []
+    for piece in pieces:
+        candidate = separator.join(text(item) for item in current + [piece])
+        if current and estimate_tokens(candidate) > max_tokens:
+            groups.append(current)
+            current = []
+        current.append(piece)
+    if current:
+        groups.append(current)
+    return groups
+
+def _split_oversized(text, max_tokens):
+    """Chia một mục quá dài: theo đề mục con, rồi theo dòng, cuối cùng cắt cứng theo ký tự"""
+    pieces = []
+    for block in _split_blocks(text):
+        if estimate_tokens(block) <= max_tokens:
+            pieces.append(block)
+            continue
+        for line in block.split('\n'):
+            if estimate_tokens(line) <= max_tokens:
+                pieces.append(line)
+            else:
+                step = max_tokens * 3
+                pieces.extend(line[i:i + step] for i in range(0, len(line), step))
+    return ['\n'.join(group) for group in _pack(pieces, max_tokens)]
+
+def chunk_document(text, max_tokens):
+    """Các phần để map: các đề mục lớn liền nhau được gộp tới gần `max_tokens`, mục vượt ngân sách được chia nhỏ.
+
+    Trả về danh sách dict {'title', 'text', 'tokens'}; tiêu đề phần liệt kê
+    tiêu đề các mục nằm trong nó.
+    """
+    units = []
+    for title, section in split_sections(text):
+        if estimate_tokens(section) <= max_tokens:
+            parts = [section]
+        else:
+            parts = _split_oversized(section, max_tokens)
+        for index, part in enumerate(parts, 1):
+            label = title if len(parts) == 1 else f"{title} ({index}/{len(parts)})"
+            units.append((label, part))
+
+    chunks = []
+    for group in _pack(units, max_tokens, separator='\n\n', text=lambda unit: unit[1]):
+        body = '\n\n'.join(part for _, part in group)
+        label = '; '.join(title for title, _ in group)
+        if len(label) > MAX_TITLE_CHARS:
+            label = label[:MAX_TITLE_CHARS - 1] + '…'
+        chunks.append({'title': label, 'text': body, 'tokens': estimate_tokens(body)})
+    return chunks
+
+def chunk_budget():
+    """Ngân sách token cho mỗi phần (GEMINI_CHUNK_TOKENS, mặc định 4000)"""
+    return int(os.environ.get('GEMINI_CHUNK_TOKENS', 4000))
+
+def single_pass_budget():
+    """File không vượt ngưỡng này (GEMINI_SINGLE_PASS_TOKENS, mặc định 8000) được phân tích một lần"""
+    return int(os.environ.get('GEMINI_SINGLE_PASS_TOKENS', 8000))
+
+def plan_document(text):
+    """Kế hoạch phân tích: số token ước tính và các phần (rỗng nếu phân tích một lần)"""
+    tokens = estimate_tokens(text)
+    chunks = chunk_document(text, chunk_budget()) if tokens > single_pass_budget() else []
+    return {'tokens': tokens, 'chunks': chunks}
+
+
+def _map_chunk(api_key, chunk, force_refresh, hedge):
+    """Tóm tắt một phần (dùng cache theo tiêu đề + nội dung phần); trả về (tóm tắt, trúng cache)"""
+    prompt = MAP_PROMPT.format(title=chunk['title'], content=chunk['text'])
+    cache = get_response_cache()
+    key = cache.key(gemini_models()[0], 'map', normalize_prompt(prompt))
+    if not force_refresh:
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0], True
+    summary, model = generate_text(api_key, prompt, hedge=hedge)
+    if is_primary_model(model):
+        cache.put(key, summary)
+    return summary, False
+
+def analyze_document(api_key, content, force_refresh=False, on_text=None, max_workers=None):
+    """Phân tích file gốc; file dài dùng map-reduce. Trả về (nội dung, thời điểm lưu cache) như `analyze_with_gemini`"""
+    plan = plan_document(content)
+    chunks = plan['chunks']
+    if len(chunks) <= 1 or not GENAI_AVAILABLE:
+        return analyze_with_gemini(api_key, "file", content, force_refresh, on_text)
+
+    hedge = hedging_enabled()
+    workers = max_workers or int(os.environ.get('GEMINI_MAP_WORKERS', 4))
+    summaries = [None] * len(chunks)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='map') as executor:
+            futures = {
+                executor.submit(_map_chunk, api_key, chunk, force_refresh, hedge): index
+                for index, chunk in enumerate(chunks)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                summaries[futures[future]] = future.result()[0]
+                if on_text:
+                    on_text(PROGRESS_NOTICE.format(done=done, total=len(chunks)))
+    except Exception as e:
+        return f"❌ Lỗi khi phân tích: {str(e)}\n\nVui lòng kiểm tra API key và kết nối internet.", None
+
+    findings = '\n\n'.join(
+        f"### {chunk['title']}\n{summary}" for chunk, summary in zip(chunks, summaries)
+    )
+    return analyze_with_gemini(api_key, "reduce", findings, force_refresh, on_text)
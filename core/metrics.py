@@ -0,0 +1,50 @@
+"""Các chỉ tiêu tài chính của phương án vay"""
+
+
+# Hàm tính toán các chỉ tiêu tài chính
+def calculate_financial_metrics(financial_info):
+    """Tính toán các chỉ tiêu tài chính"""
+    metrics = {}
+    
+    loan_amount = financial_info.get('loan_amount', 0)
+    interest_rate = financial_info.get('interest_rate', 0)
+    loan_term = financial_info.get('loan_term', 0)
+    monthly_income = financial_info.get('monthly_income', 0)
+    monthly_expense = financial_info.get('monthly_expense', 0)
+    project_income = financial_info.get('project_income', 0)
+    
+    if loan_amount > 0 and interest_rate > 0 and loan_term > 0:
+        monthly_rate = (interest_rate / 100) / 12
+        
+        if monthly_rate > 0:
+            monthly_payment = loan_amount * (monthly_rate * (1 + monthly_rate)**loan_term) / \
+                            ((1 + monthly_rate)**loan_term - 1)
+        else:
+            monthly_payment = loan_amount / loan_term
+        
+        metrics['first_month_payment'] = monthly_payment
+        
+        total_payment = monthly_payment * loan_term
+        total_interest = total_payment - loan_amount
+        metrics['total_interest'] = total_interest
+        metrics['total_payment'] = total_payment
+        
+        net_income = monthly_income + project_income - monthly_expense
+        metrics['net_income'] = net_income
+        
+        if monthly_income > 0:
+            debt_service_ratio = (monthly_payment / monthly_income) * 100
+            metrics['debt_service_ratio'] = debt_service_ratio
+        else:
+            metrics['debt_service_ratio'] = 0
+        
+        if monthly_payment > 0:
+            dscr = net_income / monthly_payment
+            metrics['dscr'] = dscr
+        else:
+            metrics['dscr'] = 0
+        
+        surplus = net_income - monthly_payment
+        metrics['surplus'] = surplus
+    
+    return metrics
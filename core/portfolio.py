@@ -0,0 +1,202 @@
+"""Tổng hợp dòng tiền gốc/lãi của cả danh mục với bộ nhớ giới hạn (np.memmap theo phân đoạn)"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from core.amortization import amortization_schedule
+
+DEFAULT_CHUNK_SIZE = 2_000
+
+
+def _month_index(values):
+    """Chuyển ngày giải ngân (chuỗi/datetime) thành chỉ số tháng kể từ 1970-01"""
+    months = pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[M]')
+    return months.astype(np.int64)
+
+
+def iter_schedule_chunks(loans, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Sinh lịch trả nợ theo từng khối khoản vay: (khối DataFrame, gốc, lãi).
+
+    Mỗi khối chỉ giữ mảng (số khoản trong khối × thời hạn dài nhất của khối)
+    nên bộ nhớ bị chặn bởi `chunk_size`, không phụ thuộc quy mô danh mục.
+    """
+    for start in range(0, len(loans), chunk_size):
+        chunk = loans.iloc[start:start + chunk_size]
+        columns = amortization_schedule(
+            chunk['loan_amount'].to_numpy(dtype=float),
+            chunk['interest_rate'].to_numpy(dtype=float),
+            chunk['loan_term'].to_numpy(dtype=int),
+        )
+        yield chunk, columns['principal'], columns['interest']
+
+
+def _accumulate(totals, group_codes, start_months, values, origin):
+    """Cộng dồn các dòng tiền (khoản × kỳ) vào ma trận (nhóm × tháng lịch) bằng bincount"""
+    n_groups, n_months = totals.shape
+    offsets = (start_months - origin + 1)[:, None] + np.arange(values.shape[1])
+    flat = group_codes[:, None] * n_months + offsets
+    mask = (values != 0) & (offsets >= 0) & (offsets < n_months)
+    totals += np.bincount(flat[mask], weights=values[mask], minlength=n_groups * n_months) \
+        .reshape(n_groups, n_months)
+
+
+def aggregate_cashflows(loans, group_by=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Tổng gốc và lãi dự kiến theo tháng (và theo nhóm) tính trực tiếp theo khối, không ghi đĩa.
+
+    `loans` cần các cột loan_amount, interest_rate, loan_term, disbursement_date;
+    `group_by` là tên cột nhóm (ví dụ sản phẩm, chi nhánh). Kỳ 1 rơi vào tháng
+    sau tháng giải ngân.
+    """
+    starts = _month_index(loans['disbursement_date'])
+    codes, groups = _group_codes(loans, group_by)
+    origin = int(starts.min())
+    n_months = int((starts + loans['loan_term'].to_numpy(dtype=int)).max()) - origin + 1
+
+    principal = np.zeros((len(groups), n_months))
+    interest = np.zeros((len(groups), n_months))
+    position = 0
+    for chunk, chunk_principal, chunk_interest in iter_schedule_chunks(loans, chunk_size):
+        rows = slice(position, position + len(chunk))
+        _accumulate(principal, codes[rows], starts[rows], chunk_principal, origin)
+        _accumulate(interest, codes[rows], starts[rows], chunk_interest, origin)
+        position += len(chunk)
+
+    return _totals_frame(principal, interest, groups, origin)
+
+
+def _group_codes(loans, group_by):
+    """Mã hóa cột nhóm thành số nguyên"""
+    if group_by is None:
+        return np.zeros(len(loans), dtype=np.int64), np.array(['Tất cả'])
+    codes, groups = pd.factorize(loans[group_by], sort=True)
+    return codes.astype(np.int64), np.asarray(groups)
+
+
+def _totals_frame(principal, interest, groups, origin):
+    """Trải ma trận tổng (nhóm × tháng) thành DataFrame dạng dài"""
+    months = (np.arange(principal.shape[1]) + origin).astype('datetime64[M]')
+    frame = pd.DataFrame({
+        'Nhóm': np.repeat(groups, len(months)),
+        'Tháng': np.tile(months, len(groups)),
+        'Tiền gốc': principal.ravel(),
+        'Tiền lãi': interest.ravel(),
+    })
+    frame['Tổng thu'] = frame['Tiền gốc'] + frame['Tiền lãi']
+    return frame[frame['Tổng thu'] != 0].reset_index(drop=True)
+
+
+class PortfolioCashflowStore:
+    """Kho lịch trả nợ của danh mục trên đĩa, mỗi lần bổ sung khoản vay là một phân đoạn memmap.
+
+    Mỗi phân đoạn lưu gốc/lãi dạng (số khoản × thời hạn dài nhất) trong tệp
+    .npy (mở bằng np.memmap khi đọc) cùng siêu dữ liệu khoản vay dạng CSV (không
+    dùng pickle vì nạp pickle từ thư mục bị sửa có thể chạy mã tùy ý); việc tổng
+    hợp duyệt từng khối dòng của từng phân đoạn nên RAM luôn bị chặn.
+
+    Mặc định float64 để tổng VND chính xác tới đồng; `dtype='float32'` giảm một
+    nửa dung lượng nhưng sai số tổng hợp cỡ vài chục đồng.
+    """
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory, dtype='float64'):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, self.MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                self.segments = json.load(f)['segments']
+        else:
+            self.segments = []
+
+    def _save_manifest(self):
+        """Ghi danh sách phân đoạn (ghi tệp tạm rồi thay thế để không hỏng khi lỗi giữa chừng)"""
+        path = os.path.join(self.directory, self.MANIFEST)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'segments': self.segments}, f, ensure_ascii=False, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return sum(segment['n_loans'] for segment in self.segments)
+
+    def append(self, loans, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Bổ sung các khoản vay mới duyệt: tính lịch theo khối và ghi thẳng vào memmap"""
+        if len(loans) == 0:
+            return None
+        name = f'segment_{len(self.segments):05d}'
+        n_periods = int(loans['loan_term'].max())
+        shape = (len(loans), n_periods)
+
+        principal = np.lib.format.open_memmap(
+            os.path.join(self.directory, f'{name}_principal.npy'), mode='w+', dtype=self.dtype, shape=shape)
+        interest = np.lib.format.open_memmap(
+            os.path.join(self.directory, f'{name}_interest.npy'), mode='w+', dtype=self.dtype, shape=shape)
+
+        position = 0
+        for chunk, chunk_principal, chunk_interest in iter_schedule_chunks(loans, chunk_size):
+            width = chunk_principal.shape[1]
+            rows = slice(position, position + len(chunk))
+            principal[rows, :width] = chunk_principal
+            interest[rows, :width] = chunk_interest
+            principal[rows, width:] = 0
+            interest[rows, width:] = 0
+            position += len(chunk)
+        principal.flush()
+        interest.flush()
+        del principal, interest
+
+        metadata = loans.drop(columns=['loan_amount', 'interest_rate', 'loan_term'], errors='ignore').copy()
+        metadata['loan_term'] = loans['loan_term'].to_numpy(dtype=int)
+        metadata['start_month'] = _month_index(loans['disbursement_date'])
+        metadata.to_csv(os.path.join(self.directory, f'{name}_loans.csv'), index=False)
+        # Kiểu của từng cột để đọc lại CSV đúng như lúc ghi
+        columns = {column: str(dtype) for column, dtype in metadata.dtypes.items()}
+
+        self.segments.append({'name': name, 'n_loans': len(loans), 'n_periods': n_periods, 'columns': columns})
+        self._save_manifest()
+        return name
+
+    def _load_segment(self, segment):
+        """Mở một phân đoạn ở chế độ chỉ đọc (memmap, không nạp toàn bộ vào RAM)"""
+        name = segment['name']
+        principal = np.load(os.path.join(self.directory, f'{name}_principal.npy'), mmap_mode='r')
+        interest = np.load(os.path.join(self.directory, f'{name}_interest.npy'), mmap_mode='r')
+        columns = segment['columns']
+        dates = [column for column, dtype in columns.items() if dtype.startswith('datetime64')]
+        metadata = pd.read_csv(
+            os.path.join(self.directory, f'{name}_loans.csv'),
+            dtype={column: dtype for column, dtype in columns.items() if column not in dates},
+            parse_dates=dates,
+        )
+        return principal, interest, metadata
+
+    def monthly_totals(self, group_by=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Tổng gốc/lãi theo tháng lịch (và theo nhóm) trên toàn bộ các phân đoạn"""
+        if not self.segments:
+            return _totals_frame(np.zeros((0, 0)), np.zeros((0, 0)), np.array([]), 0)
+
+        metadata = [self._load_segment(segment)[2] for segment in self.segments]
+        all_loans = pd.concat(metadata, ignore_index=True)
+        origin = int(all_loans['start_month'].min())
+        n_months = int((all_loans['start_month'] + all_loans['loan_term']).max()) - origin + 1
+        codes, groups = _group_codes(all_loans, group_by)
+
+        principal_totals = np.zeros((len(groups), n_months))
+        interest_totals = np.zeros((len(groups), n_months))
+        position = 0
+        for segment in self.segments:
+            principal, interest, loans = self._load_segment(segment)
+            starts = loans['start_month'].to_numpy(dtype=np.int64)
+            for start in range(0, len(loans), chunk_size):
+                rows = slice(start, start + chunk_size)
+                segment_codes = codes[position + start:position + start + len(starts[rows])]
+                _accumulate(principal_totals, segment_codes, starts[rows],
+                            np.asarray(principal[rows], dtype=float), origin)
+                _accumulate(interest_totals, segment_codes, starts[rows],
+                            np.asarray(interest[rows], dtype=float), origin)
+            position += len(loans)
+
+        return _totals_frame(principal_totals, interest_totals, groups, origin)
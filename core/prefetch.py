@@ -0,0 +1,108 @@
+"""Trích xuất nền: bắt đầu xử lý ngay khi file được tải lên, trước khi người dùng bấm nút"""
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.docx_reader import ReadCancelled
+from core.extraction import extract_document, get_extraction_cache
+
+
+class BackgroundExtractor:
+    """Chạy `extract_document` trên luồng nền, kết quả ghi vào bộ đệm trích xuất.
+
+    Mỗi tác vụ gắn với băm nội dung file và đếm số phiên đang chờ nó; khi mọi
+    phiên đã chuyển sang file khác (`cancel`), tác vụ bị hủy: chưa chạy thì bỏ
+    khỏi hàng đợi, đang chạy thì dừng ở đoạn văn kế tiếp.
+    """
+
+    def __init__(self, max_workers=2, cache=None):
+        self.cache = cache or get_extraction_cache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._jobs = {}
+        # RLock: callback hoàn thành có thể chạy ngay trong submit khi tác vụ xong quá nhanh
+        self._lock = threading.RLock()
+
+    def _run(self, key, data, cancel):
+        try:
+            result = extract_document(data, cancel)
+        except ReadCancelled:
+            return None
+        self.cache.put(key, result)
+        return result
+
+    def submit(self, data):
+        """Bắt đầu trích xuất nền cho nội dung file (bỏ qua nếu đã có trong cache); trả về khóa"""
+        key = self.cache.key(data)
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job['cancel'].is_set():
+                job['refs'] += 1
+                return key
+            if key in self.cache:
+                return key
+            cancel = threading.Event()
+            future = self._executor.submit(self._run, key, data, cancel)
+            self._jobs[key] = {'future': future, 'cancel': cancel, 'refs': 1}
+            future.add_done_callback(lambda _, key=key: self._forget(key, future))
+        return key
+
+    def _forget(self, key, future):
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job['future'] is future:
+                del self._jobs[key]
+
+    def cancel(self, key):
+        """Phiên hiện tại không cần kết quả của `key` nữa; hủy nếu không còn phiên nào chờ"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None:
+                return
+            job['refs'] -= 1
+            if job['refs'] <= 0:
+                job['cancel'].set()
+                job['future'].cancel()
+                del self._jobs[key]
+
+    def status(self, key):
+        """Trạng thái của khóa: 'ready' (đã có kết quả), 'running' hoặc 'missing'"""
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None and not job['future'].done():
+            return 'running'
+        return 'ready' if key in self.cache else 'missing'
+
+    def get(self, key, data):
+        """Lấy kết quả cho `key`: chờ tác vụ nền nếu đang chạy, nếu không có thì trích xuất ngay.
+
+        Trả về (kết quả, nguồn) với nguồn là 'prefetch', 'cache' hoặc 'fresh'.
+        Kết quả luôn là bản sao riêng của phiên gọi: nhiều phiên có thể cùng chờ
+        một tác vụ nền và sửa kết quả tại chỗ.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            result = job['future'].result()
+            if result is not None:
+                # Đọc lại qua bộ đệm (giải mã JSON thành bản sao mới) thay vì trả chung một dict
+                return self.cache.get(key) or copy.deepcopy(result), 'prefetch'
+
+        result = self.cache.get(key)
+        if result is not None:
+            return result, 'cache'
+        result = extract_document(data)
+        self.cache.put(key, result)
+        return result, 'fresh'
+
+
+_background_extractor = None
+_background_lock = threading.Lock()
+
+
+def get_background_extractor():
+    """Bộ trích xuất nền dùng chung trong tiến trình (tạo một lần)"""
+    global _background_extractor
+    with _background_lock:
+        if _background_extractor is None:
+            _background_extractor = BackgroundExtractor()
+        return _background_extractor
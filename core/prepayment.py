@@ -0,0 +1,119 @@
+"""Mô phỏng trả nợ trước hạn bằng công thức đóng của khoản vay trả đều"""
+import math
+
+import numpy as np
+
+from core.amortization import annuity_payment
+from core.daycount import payment_dates
+
+KEEP_TERM = 'keep_term'
+KEEP_PAYMENT = 'keep_payment'
+
+
+def _balance_after(balance, payment, monthly_rate, periods):
+    """Dư nợ sau `periods` kỳ trả đều `payment` (công thức đóng)"""
+    if monthly_rate > 0:
+        growth = (1 + monthly_rate) ** periods
+        return balance * growth - payment * (growth - 1) / monthly_rate
+    return balance - payment * periods
+
+
+def _periods_to_payoff(balance, payment, monthly_rate):
+    """Số kỳ cần để trả hết `balance` khi giữ nguyên khoản trả `payment`"""
+    if balance <= 0:
+        return 0
+    if monthly_rate > 0:
+        ratio = 1 - monthly_rate * balance / payment
+        if ratio <= 0:
+            return math.inf
+        periods = -math.log(ratio) / math.log(1 + monthly_rate)
+    else:
+        periods = balance / payment
+    return max(1, math.ceil(periods - 1e-9))
+
+
+def _segment_interest(balance, payment, monthly_rate, periods):
+    """Tổng lãi của đoạn trả hết nợ trong `periods` kỳ, kỳ cuối tất toán dư nợ"""
+    if periods <= 0:
+        return 0.0
+    before_last = _balance_after(balance, payment, monthly_rate, periods - 1)
+    return payment * (periods - 1) + before_last * (1 + monthly_rate) - balance
+
+
+def simulate_prepayments(loan_amount, interest_rate, loan_term, events, disbursement_date=None):
+    """Tính lại khoản vay sau các lần trả trước hạn mà không lặp từng kỳ.
+
+    `events` là danh sách (tháng, số tiền, chế độ): khoản trả trước được nộp
+    ngay sau kỳ trả nợ của tháng đó; chế độ `keep_term` giữ nguyên thời hạn và
+    giảm khoản trả hàng tháng, `keep_payment` giữ nguyên khoản trả và rút ngắn
+    thời hạn. Mỗi đoạn giữa hai sự kiện được tính bằng công thức niên kim nên
+    chi phí chỉ phụ thuộc số sự kiện, không phụ thuộc thời hạn vay.
+    """
+    loan_term = int(loan_term)
+    monthly_rate = (interest_rate / 100) / 12
+    payment = annuity_payment(loan_amount, interest_rate, loan_term)
+    baseline_interest = _segment_interest(loan_amount, payment, monthly_rate, loan_term)
+
+    balance = float(loan_amount)
+    remaining = loan_term
+    elapsed = 0
+    total_interest = 0.0
+    prepaid = 0.0
+    segments = []
+
+    for month, amount, mode in sorted(events, key=lambda event: event[0]):
+        month = int(month)
+        if balance <= 0 or month <= elapsed or month >= elapsed + remaining:
+            continue
+        periods = month - elapsed
+        balance_at_event = _balance_after(balance, payment, monthly_rate, periods)
+        total_interest += payment * periods - (balance - balance_at_event)
+        segments.append({'start_month': elapsed + 1, 'end_month': month,
+                         'opening_balance': balance, 'payment': payment})
+
+        amount = min(float(amount), balance_at_event)
+        prepaid += amount
+        balance = balance_at_event - amount
+        elapsed = month
+        remaining -= periods
+
+        if balance <= 0:
+            remaining = 0
+            break
+        if mode == KEEP_PAYMENT:
+            remaining = _periods_to_payoff(balance, payment, monthly_rate)
+        else:
+            payment = annuity_payment(balance, interest_rate, remaining)
+
+    if remaining > 0:
+        total_interest += _segment_interest(balance, payment, monthly_rate, remaining)
+        segments.append({'start_month': elapsed + 1, 'end_month': elapsed + remaining,
+                         'opening_balance': balance, 'payment': payment})
+    payoff_month = elapsed + remaining
+
+    result = {
+        'baseline_interest': baseline_interest,
+        'total_interest': total_interest,
+        'interest_saved': baseline_interest - total_interest,
+        'total_prepaid': prepaid,
+        'baseline_payoff_month': loan_term,
+        'payoff_month': payoff_month,
+        'months_saved': loan_term - payoff_month,
+        'final_payment': payment,
+        'segments': segments,
+    }
+    if disbursement_date is not None and payoff_month > 0:
+        day = np.datetime64(disbursement_date, 'D').astype(object).day
+        result['payoff_date'] = payment_dates(disbursement_date, payoff_month, day)[-1]
+    return result
+
+
+def segment_balances(segments, interest_rate):
+    """Dư nợ cuối mỗi tháng dựng lại từ các đoạn của `simulate_prepayments` (vẽ biểu đồ)"""
+    monthly_rate = (interest_rate / 100) / 12
+    balances = []
+    for segment in segments:
+        periods = np.arange(1, segment['end_month'] - segment['start_month'] + 2)
+        path = _balance_after(segment['opening_balance'], segment['payment'], monthly_rate, periods)
+        balances.append(np.maximum(path, 0.0))
+    return np.concatenate(balances) if balances else np.array([])
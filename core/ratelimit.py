@@ -0,0 +1,146 @@
+"""Giới hạn tốc độ gọi Gemini dùng chung cho mọi phiên trong tiến trình (token bucket)"""
+import os
+import threading
+import time
+from collections import deque
+
+# Số token dành trước cho phần trả lời khi chưa biết độ dài thực tế
+OUTPUT_ALLOWANCE = 1024
+
+
+def estimate_tokens(text):
+    """Ước lượng số token của văn bản (tiếng Việt trung bình ~3 ký tự/token)"""
+    return len(text) // 3 + 1
+
+
+class RateLimitTimeout(TimeoutError):
+    """Không thể tới lượt gọi trước hạn chót của thao tác"""
+
+
+class RateLimiter:
+    """Hai thùng token: số yêu cầu/phút và số token/phút, an toàn luồng.
+
+    Người gọi được phục vụ theo thứ tự đến (FIFO) nên một phiên gửi liên tục
+    không chiếm hết lượt của các phiên khác. Thùng token có thể âm sau khi
+    `settle` ghi nhận số token thực tế lớn hơn phần đã dành trước; các yêu cầu
+    sau sẽ chờ cho tới khi bù lại.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.total_wait = 0.0
+        self.waited_calls = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens, position=0):
+        """Số giây cần chờ để đủ lượt cho người ở vị trí `position` trong hàng đợi"""
+        need_requests = max(0.0, position + 1 - self._requests) * 60 / self.rpm
+        need_tokens = max(0.0, (position + 1) * tokens - self._tokens) * 60 / self.tpm
+        return max(need_requests, need_tokens)
+
+    def acquire(self, tokens=1, on_wait=None, deadline_at=None):
+        """Chờ tới lượt và trừ 1 yêu cầu + `tokens` token; trả về số giây đã chờ.
+
+        `on_wait(giây_ước_tính)` được gọi một lần nếu phải chờ, ngoài khóa
+        chung để callback chậm (ghi giao diện) không chặn các phiên khác.
+        Ném RateLimitTimeout ngay khi thời gian chờ ước tính vượt quá
+        `deadline_at` (theo time.monotonic) thay vì xếp hàng vô ích.
+        """
+        tokens = min(tokens, self.tpm)
+        ticket = object()
+        started = time.monotonic()
+        had_to_wait = False
+        pending_notice = None
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                if pending_notice is not None:
+                    on_wait(pending_notice)
+                    pending_notice = None
+                with self._cond:
+                    self._refill()
+                    position = self._queue.index(ticket)
+                    wait = self._wait_time(tokens, position)
+                    if position == 0 and wait <= 0:
+                        self._requests -= 1
+                        self._tokens -= tokens
+                        break
+                    if deadline_at is not None and time.monotonic() + wait > deadline_at:
+                        raise RateLimitTimeout(
+                            f"Cần chờ khoảng {wait:.0f}s tới lượt gọi, vượt quá thời gian cho phép"
+                        )
+                    if not had_to_wait:
+                        had_to_wait = True
+                        if on_wait:
+                            # Nhả khóa để báo cho người gọi rồi tính lại trạng thái
+                            pending_notice = wait
+                            continue
+                    # Người đứng đầu chờ đủ token; những người sau chờ tới khi hàng đợi dịch chuyển
+                    self._cond.wait(wait if position == 0 else None)
+        finally:
+            with self._cond:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+        waited = time.monotonic() - started
+        if had_to_wait:
+            with self._cond:
+                self.total_wait += waited
+                self.waited_calls += 1
+        return waited
+
+    def settle(self, reserved, actual):
+        """Điều chỉnh thùng token theo số token thực tế của yêu cầu đã xong"""
+        with self._cond:
+            self._tokens += reserved - actual
+            self._cond.notify_all()
+
+    def estimate_wait(self, tokens=OUTPUT_ALLOWANCE):
+        """Ước tính thời gian chờ cho một yêu cầu mới xếp sau toàn bộ hàng đợi hiện tại"""
+        with self._cond:
+            self._refill()
+            return self._wait_time(tokens, len(self._queue))
+
+    def stats(self):
+        """Số yêu cầu đang xếp hàng, thời gian chờ trung bình và ước tính cho yêu cầu kế tiếp"""
+        with self._cond:
+            queued = len(self._queue)
+            average = self.total_wait / self.waited_calls if self.waited_calls else 0.0
+        return {
+            'queued': queued,
+            'waited_calls': self.waited_calls,
+            'average_wait': average,
+            'next_wait': self.estimate_wait(),
+        }
+
+
+_gemini_limiter = None
+_gemini_lock = threading.Lock()
+
+
+def get_gemini_limiter():
+    """Bộ giới hạn dùng chung cho mọi lần gọi Gemini trong tiến trình.
+
+    Cấu hình qua GEMINI_RPM (yêu cầu/phút, mặc định 15) và GEMINI_TPM
+    (token/phút, mặc định 1.000.000).
+    """
+    global _gemini_limiter
+    with _gemini_lock:
+        if _gemini_limiter is None:
+            _gemini_limiter = RateLimiter(
+                rpm=float(os.environ.get('GEMINI_RPM', 15)),
+                tpm=float(os.environ.get('GEMINI_TPM', 1_000_000)),
+            )
+        return _gemini_limiter
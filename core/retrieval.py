@@ -0,0 +1,120 @@
+"""Tìm đoạn liên quan trong file PASDV để đưa vào prompt chatbot (BM25 trong bộ nhớ)
+
+Mỗi đoạn văn / dòng bảng là một đoạn tìm kiếm. Tách từ kiểu tiếng Việt: mỗi
+âm tiết là một từ, thêm cặp âm tiết liền nhau (bigram) để khớp từ ghép như
+"lãi suất", "tài sản", và dạng bỏ dấu để câu hỏi gõ không dấu vẫn tìm được.
+Chỉ mục được dựng một lần cho mỗi nội dung file và dùng lại theo băm nội dung.
+"""
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from core.cache import LRUCache, content_hash
+
+# Dòng ngắn hơn (ví dụ đề mục) được ghép với dòng kế tiếp để giữ ngữ cảnh
+MIN_PASSAGE_CHARS = 40
+# Đoạn dài hơn bị cắt khi đưa vào prompt
+MAX_PASSAGE_CHARS = 600
+# Bỏ các đoạn có điểm dưới tỷ lệ này so với đoạn tốt nhất (chỉ khớp từ phổ biến)
+MIN_RELATIVE_SCORE = 0.2
+
+WORD = re.compile(r'\w+')
+
+
+def _strip_accents(text):
+    """Bỏ dấu tiếng Việt ('lãi suất' -> 'lai suat')"""
+    decomposed = unicodedata.normalize('NFD', text.replace('đ', 'd').replace('Đ', 'D'))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+def tokenize(text):
+    """Âm tiết, cặp âm tiết liền nhau và âm tiết bỏ dấu (chữ thường, Unicode NFC)"""
+    syllables = WORD.findall(unicodedata.normalize('NFC', text).lower())
+    tokens = list(syllables)
+    tokens.extend(f'{a}_{b}' for a, b in zip(syllables, syllables[1:]))
+    tokens.extend('~' + folded for folded in map(_strip_accents, syllables))
+    return tokens
+
+def split_passages(text):
+    """Các đoạn tìm kiếm: mỗi dòng khác rỗng, dòng quá ngắn được ghép với dòng sau"""
+    passages, pending = [], []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        pending.append(line)
+        if sum(len(part) for part in pending) >= MIN_PASSAGE_CHARS:
+            passages.append(' — '.join(pending))
+            pending = []
+    if pending:
+        passages.append(' — '.join(pending))
+    return passages
+
+
+class BM25Index:
+    """Chỉ mục BM25 (Okapi) trên danh sách đoạn văn bản"""
+
+    def __init__(self, passages, k1=1.5, b=0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(list)
+        self._lengths = []
+        for index, passage in enumerate(passages):
+            counts = Counter(tokenize(passage))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._postings[term].append((index, tf))
+        self._average = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        total = len(passages)
+        self._idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def scores(self, query):
+        """Điểm BM25 của các đoạn có ít nhất một từ khớp: {chỉ số đoạn: điểm}"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[index] / self._average)
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, top_k=5):
+        """Tối đa `top_k` đoạn liên quan nhất, giữ theo thứ tự xuất hiện trong tài liệu"""
+        scores = self.scores(query)
+        if not scores:
+            return []
+        cutoff = max(scores.values()) * MIN_RELATIVE_SCORE
+        best = [index for index in sorted(scores, key=scores.get, reverse=True)[:top_k] if scores[index] >= cutoff]
+        return [self.passages[index] for index in sorted(best)]
+
+
+_index_cache = LRUCache(16)
+_index_lock = threading.Lock()
+
+
+def get_document_index(text):
+    """Chỉ mục BM25 của nội dung file, dựng một lần cho mỗi nội dung (tra theo băm)"""
+    key = content_hash(text)
+    index = _index_cache.get(key)
+    if index is None:
+        with _index_lock:
+            index = _index_cache.get(key)
+            if index is None:
+                index = BM25Index(split_passages(text))
+                _index_cache.put(key, index)
+    return index
+
+def retrieve_passages(text, question, top_k=None):
+    """Các đoạn của file liên quan tới câu hỏi (CHAT_TOP_K đoạn, mặc định 5), đã cắt độ dài"""
+    if not text:
+        return []
+    top_k = top_k or int(os.environ.get('CHAT_TOP_K', 5))
+    return [passage[:MAX_PASSAGE_CHARS] for passage in get_document_index(text).search(question, top_k)]
@@ -0,0 +1,214 @@
+"""Chính sách thử lại cho lời gọi API: phân loại lỗi, backoff có jitter, hạn chót, cầu dao và mô hình dự phòng"""
+import random
+import threading
+import time
+
+# Mã HTTP đáng thử lại: hết hạn mức / quá tải / lỗi máy chủ / hết thời gian
+RETRIABLE_STATUS = {408, 429, 500, 502, 503, 504}
+TIMEOUT_STATUS = {408, 504}
+
+# Lỗi không bao giờ thử lại (bị chặn bởi bộ lọc an toàn, không kịp lượt gọi trước hạn chót...),
+# nhận diện theo tên lớp để không phải import SDK
+FATAL_ERRORS = {'BlockedPromptException', 'StopCandidateException', 'BlockedResponseError', 'RateLimitTimeout'}
+RETRIABLE_ERRORS = {'DeadlineExceeded', 'ServiceUnavailable', 'ResourceExhausted', 'TooManyRequests',
+                    'InternalServerError', 'BadGateway', 'GatewayTimeout', 'RetryError',
+                    'EmptyResponseError'}
+TIMEOUT_ERRORS = {'DeadlineExceeded', 'GatewayTimeout'}
+# Hết hạn mức của một API key: thử lại được nhưng không phải lỗi của dịch vụ nên không tính cho cầu dao
+QUOTA_STATUS = {429}
+QUOTA_ERRORS = {'ResourceExhausted', 'TooManyRequests'}
+
+
+class CircuitOpenError(RuntimeError):
+    """Cầu dao đang mở: tạm ngưng gọi dịch vụ đang lỗi"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} đang gặp sự cố, tạm ngưng gọi trong {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def _status_code(exc):
+    code = getattr(exc, 'code', None)
+    return code if isinstance(code, int) else None
+
+def is_retriable(exc):
+    """Lỗi tạm thời (429, 5xx, hết thời gian, mất kết nối) thì thử lại; lỗi khóa API, dữ liệu, an toàn thì không"""
+    name = type(exc).__name__
+    if name in FATAL_ERRORS or isinstance(exc, CircuitOpenError):
+        return False
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRIABLE_STATUS
+    return name in RETRIABLE_ERRORS or isinstance(exc, (TimeoutError, ConnectionError))
+
+def is_quota_error(exc):
+    """Lỗi hết hạn mức (429) của API key đang dùng"""
+    return type(exc).__name__ in QUOTA_ERRORS or _status_code(exc) in QUOTA_STATUS
+
+def trips_breaker(exc):
+    """Lỗi tính cho cầu dao: lỗi tạm thời của dịch vụ (5xx, hết thời gian), không tính 429"""
+    return is_retriable(exc) and not is_quota_error(exc)
+
+def is_timeout(exc):
+    """Lỗi do hết thời gian chờ"""
+    return (
+        isinstance(exc, TimeoutError)
+        or type(exc).__name__ in TIMEOUT_ERRORS
+        or _status_code(exc) in TIMEOUT_STATUS
+    )
+
+
+class CircuitBreaker:
+    """Cầu dao dùng chung: mở sau `failure_threshold` lỗi tạm thời liên tiếp.
+
+    Khi mở, mọi lời gọi bị từ chối ngay trong `reset_timeout` giây; hết thời
+    gian đó cho đúng một lời gọi thử (nửa mở), thành công thì đóng lại, thất
+    bại thì mở tiếp.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def before_call(self):
+        """Ném CircuitOpenError nếu cầu dao đang mở hoặc đã có lời gọi thử khác"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(self.name, max(remaining, 1.0))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """Lời gọi kết thúc với lỗi không tính cho cầu dao (ví dụ khóa API sai)"""
+        with self._lock:
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, scope=None, failure_threshold=5, reset_timeout=30.0):
+    """Cầu dao dùng chung trong tiến trình theo (phạm vi, tên), ví dụ (băm API key, tên mô hình).
+
+    Mỗi phạm vi có cầu dao riêng nên lỗi của một API key không chặn các key khác.
+    """
+    with _breakers_lock:
+        if (scope, name) not in _breakers:
+            _breakers[(scope, name)] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return _breakers[(scope, name)]
+
+
+class RetryPolicy:
+    """Thử lại lỗi tạm thời với backoff lũy thừa full jitter trong một hạn chót chung.
+
+    `attempt_timeout` là thời gian chờ tối đa giữa hai lần có dữ liệu (tới
+    đoạn đầu tiên và giữa các đoạn khi stream), không giới hạn tổng thời gian
+    của một câu trả lời dài; `deadline` là tổng thời gian cho cả thao tác
+    (mọi lần thử, mọi mô hình dự phòng).
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, attempt_timeout=30.0, deadline=90.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        """Thời gian chờ trước lần thử thứ `attempt + 1` (full jitter)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, func, breaker=None, deadline_at=None, retry_timeouts=True):
+        """Gọi `func(idle_timeout, remaining)` theo chính sách; ném lỗi cuối cùng nếu không thành công.
+
+        `idle_timeout` là thời gian chờ dữ liệu tối đa, `remaining` là thời gian
+        còn lại tới hạn chót (dùng làm hạn của cả lời gọi).
+
+        Với `retry_timeouts=False`, lỗi hết thời gian được ném ra ngay để người
+        gọi chuyển sang mô hình dự phòng thay vì chờ thêm ở mô hình hiện tại.
+        """
+        deadline_at = deadline_at or time.monotonic() + self.deadline
+        for attempt in range(self.max_attempts):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Hết thời gian cho phép của thao tác")
+            if breaker is not None:
+                breaker.before_call()
+            try:
+                result = func(min(self.attempt_timeout, remaining), remaining)
+            except Exception as e:
+                retriable = is_retriable(e)
+                if breaker is not None:
+                    if trips_breaker(e):
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                if not retriable or attempt == self.max_attempts - 1:
+                    raise
+                if is_timeout(e) and not retry_timeouts:
+                    raise
+                delay = self.backoff(attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+
+def call_with_fallback(make_call, models, policy=None, on_fallback=None, scope=None):
+    """Gọi lần lượt theo chuỗi mô hình; trả về (kết quả, mô hình đã dùng).
+
+    `make_call(model)` trả về hàm `func(idle_timeout, remaining)`. Chuyển sang mô hình kế tiếp
+    khi mô hình hiện tại hết thời gian, cầu dao đang mở hoặc hết lượt thử lại
+    với lỗi tạm thời; lỗi không thể thử lại (khóa API sai...) được ném ra ngay.
+    Cầu dao được lấy theo (`scope`, mô hình).
+    """
+    policy = policy or RetryPolicy()
+    deadline_at = time.monotonic() + policy.deadline
+    last_error = None
+    for index, model in enumerate(models):
+        is_last = index == len(models) - 1
+        if last_error is not None and on_fallback:
+            on_fallback(model, last_error)
+        try:
+            return policy.call(make_call(model), get_breaker(model, scope), deadline_at, retry_timeouts=is_last), model
+        except CircuitOpenError as e:
+            last_error = e
+        except Exception as e:
+            if not is_retriable(e) or time.monotonic() >= deadline_at:
+                raise
+            last_error = e
+    raise last_error
@@ -0,0 +1,46 @@
+"""Lưới độ nhạy các chỉ tiêu tài chính theo lãi suất × thời hạn × cú sốc thu nhập"""
+import numpy as np
+
+from core.amortization import annuity_payment
+
+
+def default_grid(interest_rate, loan_term, n_rates=40, n_terms=30, n_shocks=11):
+    """Lưới mặc định quanh phương án hiện tại: ±4%/năm, 50%-150% thời hạn, sốc thu nhập ±50%"""
+    rates = np.linspace(max(interest_rate - 4, 0.1), interest_rate + 4, n_rates)
+    terms = np.unique(np.linspace(max(loan_term * 0.5, 6), max(loan_term * 1.5, 12), n_terms).round()).astype(int)
+    shocks = np.linspace(-0.5, 0.5, n_shocks)
+    return rates, terms, shocks
+
+
+def metrics_grid(financial_info, rates, terms, income_shocks):
+    """Tính DSCR, DTI, số dư trên toàn lưới Descartes trong một lần broadcast NumPy.
+
+    Kết quả là các mảng dạng (số lãi suất, số thời hạn, số cú sốc). Cú sốc thu
+    nhập là tỷ lệ (ví dụ -0.2 = giảm 20%) áp lên cả thu nhập hàng tháng và thu
+    nhập từ dự án; chi phí giữ nguyên. Công thức khớp `calculate_financial_metrics`.
+    """
+    loan_amount = financial_info.get('loan_amount', 0)
+    monthly_income = financial_info.get('monthly_income', 0)
+    monthly_expense = financial_info.get('monthly_expense', 0)
+    project_income = financial_info.get('project_income', 0)
+
+    rates = np.asarray(rates, dtype=float)[:, None, None]
+    terms = np.asarray(terms, dtype=float)[None, :, None]
+    shocks = 1 + np.asarray(income_shocks, dtype=float)[None, None, :]
+
+    payment = annuity_payment(loan_amount, rates, terms)
+    income = monthly_income * shocks
+    net_income = (monthly_income + project_income) * shocks - monthly_expense
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dscr = np.where(payment > 0, net_income / payment, 0.0)
+        debt_service_ratio = np.where(income > 0, payment / income * 100, 0.0)
+
+    shape = np.broadcast_shapes(payment.shape, net_income.shape)
+    return {
+        'payment': np.broadcast_to(payment, shape),
+        'net_income': np.broadcast_to(net_income, shape),
+        'dscr': np.broadcast_to(dscr, shape),
+        'debt_service_ratio': np.broadcast_to(debt_service_ratio, shape),
+        'surplus': net_income - payment,
+    }
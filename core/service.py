@@ -0,0 +1,384 @@
+"""Dịch vụ HTTP thẩm định cục bộ cho hệ thống khởi tạo khoản vay
+
+Dùng chung các hàm lõi với app.py (trích xuất, chỉ tiêu tài chính, bộ quy tắc,
+lịch trả nợ). Số yêu cầu được nhận cùng lúc bị giới hạn bởi `workers + queue`;
+vượt quá thì trả 503 kèm Retry-After ngay khi kết nối tới thay vì xếp hàng vô hạn.
+
+Ví dụ:
+    python -m core.service --port 8502 --workers 8 --queue 64
+    curl -X POST --data-binary @PASDV.docx -H "Content-Type: application/octet-stream" \\
+        "http://127.0.0.1:8502/appraise?schedule=1"
+    curl -X POST -H "Content-Type: application/json" http://127.0.0.1:8502/appraise \\
+        -d '{"financial_info": {"loan_amount": 5e9, "interest_rate": 8.5, "loan_term": 60,
+             "monthly_income": 1e8, "monthly_expense": 4.5e7}, "collateral_info": {"value": 6e9}}'
+    curl http://127.0.0.1:8502/stats
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from core.amortization import amortization_schedule
+from core.extraction import extract_document_cached, get_extraction_cache
+from core.metrics import calculate_financial_metrics
+from core.rules import appraisal_frame, evaluate_rules
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+REQUEST_TIMEOUT = 30
+
+NUMERIC_FIELDS = {
+    'financial_info': ['loan_amount', 'interest_rate', 'loan_term', 'monthly_income',
+                       'monthly_expense', 'project_income'],
+    'collateral_info': ['value'],
+}
+
+
+class BadRequest(ValueError):
+    """Dữ liệu yêu cầu không hợp lệ (trả về 400)"""
+
+
+def _to_json(value):
+    """Chuyển kiểu numpy sang kiểu Python khi tuần tự hóa JSON"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} không tuần tự hóa được')
+
+
+def _finite_values(mapping):
+    """Thay các số không hữu hạn (Infinity/NaN, ví dụ LTV khi chưa có tài sản bảo đảm) bằng None"""
+    return {
+        key: None if isinstance(value, (float, np.floating)) and not math.isfinite(value) else value
+        for key, value in mapping.items()
+    }
+
+
+def _clean_info(payload, name):
+    """Lấy và ép kiểu số cho một khối thông tin trong JSON đầu vào"""
+    info = payload.get(name) or {}
+    if not isinstance(info, dict):
+        raise BadRequest(f'{name} phải là object')
+    info = dict(info)
+    for field in NUMERIC_FIELDS.get(name, []):
+        if field in info:
+            try:
+                info[field] = float(info[field])
+            except (TypeError, ValueError):
+                raise BadRequest(f'{name}.{field} phải là số')
+            # json.loads chấp nhận NaN/Infinity; các giá trị này làm hỏng phép tính phía sau
+            if not math.isfinite(info[field]):
+                raise BadRequest(f'{name}.{field} phải là số hữu hạn')
+    if 'loan_term' in info:
+        info['loan_term'] = int(info['loan_term'])
+    return info
+
+
+def appraise(financial_info, collateral_info, customer_info=None, include_schedule=False):
+    """Tính chỉ tiêu, xếp hạng theo bộ quy tắc và (tùy chọn) lịch trả nợ cho một hồ sơ"""
+    metrics = calculate_financial_metrics(financial_info)
+    grading = evaluate_rules(appraisal_frame(financial_info, metrics, collateral_info))
+    result = {
+        'customer_info': customer_info or {},
+        'financial_info': financial_info,
+        'collateral_info': collateral_info,
+        'metrics': _finite_values(metrics),
+        'grading': _finite_values(grading.iloc[0].to_dict()),
+    }
+    loan_amount = financial_info.get('loan_amount', 0)
+    loan_term = financial_info.get('loan_term', 0)
+    if include_schedule and loan_amount > 0 and loan_term > 0:
+        # Dạng cột (mỗi khóa một mảng) gọn hơn nhiều so với danh sách từng kỳ
+        result['schedule'] = amortization_schedule(loan_amount, financial_info.get('interest_rate', 0), int(loan_term))
+    return result
+
+
+def appraise_payload(kind, payload, include_schedule=False):
+    """Xử lý một yêu cầu đã đọc xong: `kind` là 'docx' (bytes) hoặc 'json' (dict)"""
+    if kind == 'docx':
+        extracted, hit = extract_document_cached(payload)
+        result = appraise(extracted['financial'], extracted['collateral'], extracted['customer'], include_schedule)
+        result['extraction'] = {'report': extracted['report'], 'cache_hit': hit}
+        return result
+    return appraise(
+        _clean_info(payload, 'financial_info'),
+        _clean_info(payload, 'collateral_info'),
+        payload.get('customer_info'),
+        include_schedule,
+    )
+
+
+class ServiceStats:
+    """Bộ đếm yêu cầu, độ trễ (p50/p95/p99) và thông lượng, an toàn luồng"""
+
+    def __init__(self, window=10_000):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.status_counts = {}
+        self.rejected = 0
+        self.in_flight = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, status, elapsed_ms):
+        with self._lock:
+            self.in_flight -= 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self._latencies.append((time.time(), elapsed_ms))
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+            self.status_counts[503] = self.status_counts.get(503, 0) + 1
+
+    def snapshot(self, throughput_window=60):
+        """Ảnh chụp số liệu hiện tại cho endpoint /stats"""
+        now = time.time()
+        with self._lock:
+            samples = list(self._latencies)
+            counts = dict(self.status_counts)
+            rejected = self.rejected
+            in_flight = self.in_flight
+        latencies = np.array([ms for _, ms in samples]) if samples else np.zeros(0)
+        recent = sum(1 for ts, _ in samples if ts >= now - throughput_window)
+        span = min(throughput_window, max(now - self.started, 1e-9))
+        stats = {
+            'uptime_s': round(now - self.started, 1),
+            'requests': sum(counts.values()),
+            'status_counts': {str(code): n for code, n in sorted(counts.items())},
+            'rejected': rejected,
+            'in_flight': in_flight,
+            'throughput_rps': round(recent / span, 2),
+        }
+        if latencies.size:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            stats['latency_ms'] = {
+                'p50': round(float(p50), 2),
+                'p95': round(float(p95), 2),
+                'p99': round(float(p99), 2),
+                'max': round(float(latencies.max()), 2),
+                'samples': int(latencies.size),
+            }
+        return stats
+
+
+class AppraisalHandler(BaseHTTPRequestHandler):
+    """Các endpoint: GET /health, GET /stats, POST /appraise"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AppraisalService/1.0'
+    # Kết nối keep-alive nhàn rỗi quá lâu sẽ bị đóng để trả chỗ cho yêu cầu khác
+    timeout = 5
+    # Việc tính toán đã quá hạn nhưng vẫn đang chạy (server giữ chỗ tới khi nó xong)
+    orphan = None
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body, headers=None):
+        # allow_nan=False: JSON chuẩn không có Infinity/NaN, client chặt chẽ sẽ từ chối
+        data = json.dumps(body, ensure_ascii=False, default=_to_json, allow_nan=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self._status = status
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/stats':
+            self._send_json(200, self.server.stats_snapshot())
+        else:
+            self._send_json(404, {'error': 'Không tìm thấy endpoint'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/appraise':
+            self._send_json(404, {'error': 'Không tìm thấy endpoint'})
+            return
+
+        started = time.perf_counter()
+        self.server.stats.begin()
+        self._status = 500
+        try:
+            self._appraise(url)
+        finally:
+            self.server.stats.end(self._status, (time.perf_counter() - started) * 1000)
+
+    def _appraise(self, url):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_json(400, {'error': 'Thiếu nội dung yêu cầu'})
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {'error': f'Nội dung vượt quá {MAX_BODY_BYTES // (1024 * 1024)} MB'})
+            return
+        body = self.rfile.read(length)
+
+        query = parse_qs(url.query)
+        include_schedule = query.get('schedule', ['0'])[0].lower() in ('1', 'true', 'yes')
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        is_json = content_type == 'application/json'
+        try:
+            if is_json:
+                payload = json.loads(body)
+                if not isinstance(payload, dict):
+                    raise BadRequest('JSON phải là object')
+                include_schedule = include_schedule or bool(payload.get('schedule'))
+                job = ('json', payload, include_schedule)
+            else:
+                job = ('docx', body, include_schedule)
+            future = self.server.executor.submit(appraise_payload, *job)
+            result = future.result(timeout=REQUEST_TIMEOUT)
+        except (BadRequest, UnicodeDecodeError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except TimeoutError:
+            # Việc chưa chạy thì hủy; đang chạy thì không dừng được nên kết nối giữ chỗ của nó
+            # tới khi việc xong (xem AppraisalServer._process) để không nhận thêm quá sức chứa
+            if not future.cancel():
+                self.orphan = future
+                self.close_connection = True
+            self._send_json(504, {'error': 'Quá thời gian xử lý'})
+            return
+        except Exception as e:
+            self._send_json(500 if is_json else 422, {'error': f'{type(e).__name__}: {e}'})
+            return
+        self._send_json(200, result)
+
+
+class AppraisalServer(HTTPServer):
+    """HTTPServer với nhóm luồng xử lý giới hạn và từ chối sớm (503) khi quá tải.
+
+    Mỗi kết nối được nhận chiếm một chỗ trong `workers + queue`; tính toán chạy
+    trên `executor` (luồng hoặc tiến trình) với tối đa `workers` việc cùng lúc,
+    phần còn lại xếp hàng. Hết chỗ thì trả 503 ngay tại luồng nhận kết nối.
+    """
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, workers=None, queue=64, processes=False, verbose=False):
+        workers = workers or os.cpu_count() or 4
+        super().__init__(address, AppraisalHandler)
+        self.workers = workers
+        self.queue = queue
+        self.processes = processes
+        self.verbose = verbose
+        self.stats = ServiceStats()
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._connections = ThreadPoolExecutor(max_workers=workers + queue, thread_name_prefix='http')
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='appraise')
+
+    def process_request(self, request, client_address):
+        if not self._slots.acquire(blocking=False):
+            self.stats.reject()
+            self._reject(request)
+            self.shutdown_request(request)
+            return
+        self._connections.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        orphan = None
+        try:
+            handler = self.RequestHandlerClass(request, client_address, self)
+            orphan = handler.orphan
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if orphan is not None:
+                # Việc quá hạn vẫn chiếm một worker: chỉ trả chỗ khi nó thực sự xong
+                orphan.add_done_callback(lambda _: self._slots.release())
+            else:
+                self._slots.release()
+
+    def _reject(self, request):
+        """Trả 503 thô (không qua handler) để luồng nhận kết nối không bị chặn"""
+        body = json.dumps({'error': 'Dịch vụ đang quá tải, vui lòng thử lại'}, ensure_ascii=False).encode('utf-8')
+        head = (
+            'HTTP/1.1 503 Service Unavailable\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Retry-After: 1\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode('ascii')
+        try:
+            request.setblocking(False)
+            # Đọc bỏ phần yêu cầu đã tới để đóng kết nối không bị RST trước khi client nhận phản hồi
+            try:
+                while request.recv(65536):
+                    pass
+            except (BlockingIOError, InterruptedError):
+                pass
+            request.setblocking(True)
+            request.settimeout(1)
+            request.sendall(head + body)
+        except OSError:
+            pass
+
+    def stats_snapshot(self):
+        stats = self.stats.snapshot()
+        stats['workers'] = self.workers
+        stats['queue'] = self.queue
+        stats['executor'] = 'process' if self.processes else 'thread'
+        if not self.processes:
+            stats['extraction_cache'] = get_extraction_cache().stats()
+        return stats
+
+    def server_close(self):
+        super().server_close()
+        self._connections.shutdown(wait=False, cancel_futures=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Dịch vụ HTTP thẩm định PASDV')
+    parser.add_argument('--host', default='127.0.0.1', help='Địa chỉ lắng nghe')
+    parser.add_argument('--port', type=int, default=8502, help='Cổng lắng nghe')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='Số việc tính toán chạy cùng lúc')
+    parser.add_argument('-q', '--queue', type=int, default=64, help='Số yêu cầu được xếp hàng chờ trước khi trả 503')
+    parser.add_argument('--processes', action='store_true',
+                        help='Tính toán trên nhóm tiến trình (tận dụng nhiều lõi CPU cho file .docx)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Ghi log từng yêu cầu')
+    args = parser.parse_args(argv)
+
+    server = AppraisalServer((args.host, args.port), args.workers, args.queue, args.processes, args.verbose)
+    print(
+        f'Dịch vụ thẩm định: http://{args.host}:{args.port} '
+        f'({server.workers} {"tiến trình" if args.processes else "luồng"}, hàng đợi {args.queue})',
+        file=sys.stderr
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Kiểm tra sức chịu đựng Monte Carlo cho thu nhập và lãi suất thả nổi"""
+import numpy as np
+
+from core.amortization import variable_rate_payments
+
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def simulate_income_paths(rng, initial, n_paths, n_months, drift, volatility):
+    """Đường thu nhập log-normal hàng tháng (drift, volatility theo năm)"""
+    dt = 1 / 12
+    shocks = rng.standard_normal((n_paths, n_months))
+    log_steps = (drift - volatility ** 2 / 2) * dt + volatility * np.sqrt(dt) * shocks
+    return initial * np.exp(np.cumsum(log_steps, axis=1))
+
+
+def simulate_rate_paths(rng, initial, n_paths, n_months, long_run, reversion, volatility, floor=0.0):
+    """Đường lãi suất %/năm hồi quy về trung bình (Vasicek rời rạc theo tháng)"""
+    dt = 1 / 12
+    shocks = volatility * np.sqrt(dt) * rng.standard_normal((n_paths, n_months))
+    rates = np.empty((n_paths, n_months))
+    current = np.full(n_paths, float(initial))
+    # Đệ quy AR(1) theo tháng, vector hóa trên toàn bộ các đường
+    for month in range(n_months):
+        current = current + reversion * (long_run - current) * dt + shocks[:, month]
+        np.maximum(current, floor, out=current)
+        rates[:, month] = current
+    return rates
+
+
+def _simulate_chunk(rng, financial_info, n_paths, params):
+    """Mô phỏng một khối đường: trả về (surplus, dscr) dạng (đường × tháng)"""
+    loan_amount = financial_info.get('loan_amount', 0)
+    interest_rate = financial_info.get('interest_rate', 0)
+    loan_term = int(financial_info.get('loan_term', 0))
+    monthly_expense = financial_info.get('monthly_expense', 0)
+
+    income = simulate_income_paths(rng, financial_info.get('monthly_income', 0), n_paths, loan_term,
+                                   params['income_drift'], params['income_volatility'])
+    project = simulate_income_paths(rng, financial_info.get('project_income', 0), n_paths, loan_term,
+                                    params['income_drift'], params['project_volatility'])
+    rates = simulate_rate_paths(rng, interest_rate, n_paths, loan_term,
+                                params['rate_long_run'] if params['rate_long_run'] is not None else interest_rate,
+                                params['rate_reversion'], params['rate_volatility'])
+
+    payment = variable_rate_payments(loan_amount, rates)
+    net_income = income + project - monthly_expense
+    surplus = net_income - payment
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dscr = np.where(payment > 0, net_income / payment, 0.0)
+    return surplus, dscr
+
+
+def simulate_stress(financial_info, n_paths=10_000, seed=None, chunk_size=None,
+                    income_drift=0.0, income_volatility=0.10, project_volatility=0.25,
+                    rate_volatility=1.0, rate_reversion=0.5, rate_long_run=None,
+                    percentiles=DEFAULT_PERCENTILES, band_paths=5_000):
+    """Mô phỏng `n_paths` kịch bản thu nhập và lãi suất suốt thời hạn vay.
+
+    Trả về xác suất số dư âm, DSCR < 1 tại bất kỳ tháng nào và dải phân vị
+    theo tháng để vẽ biểu đồ. Khi đặt `chunk_size`, các đường được mô phỏng
+    theo từng khối để giới hạn bộ nhớ: xác suất được cộng dồn chính xác trên
+    toàn bộ đường, còn dải phân vị lấy từ một mẫu tối đa `band_paths` đường
+    chia đều cho các khối. Kết quả tái lập được với cùng `seed` và `chunk_size`.
+    """
+    loan_term = int(financial_info.get('loan_term', 0))
+    if loan_term <= 0 or n_paths <= 0:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    params = {
+        'income_drift': income_drift,
+        'income_volatility': income_volatility,
+        'project_volatility': project_volatility,
+        'rate_volatility': rate_volatility,
+        'rate_reversion': rate_reversion,
+        'rate_long_run': rate_long_run,
+    }
+    chunk_size = int(chunk_size or n_paths)
+    band_share = min(1.0, band_paths / n_paths)
+
+    negative_surplus = 0
+    low_dscr = 0
+    any_breach = 0
+    surplus_samples = []
+    dscr_samples = []
+
+    for start in range(0, n_paths, chunk_size):
+        size = min(chunk_size, n_paths - start)
+        surplus, dscr = _simulate_chunk(rng, financial_info, size, params)
+
+        surplus_breach = (surplus < 0).any(axis=1)
+        dscr_breach = (dscr < 1.0).any(axis=1)
+        negative_surplus += int(surplus_breach.sum())
+        low_dscr += int(dscr_breach.sum())
+        any_breach += int((surplus_breach | dscr_breach).sum())
+
+        keep = max(1, int(np.ceil(size * band_share)))
+        surplus_samples.append(surplus[:keep].copy())
+        dscr_samples.append(dscr[:keep].copy())
+
+    surplus_samples = np.concatenate(surplus_samples)
+    dscr_samples = np.concatenate(dscr_samples)
+    return {
+        'n_paths': n_paths,
+        'months': np.arange(1, loan_term + 1),
+        'prob_negative_surplus': negative_surplus / n_paths,
+        'prob_dscr_below_1': low_dscr / n_paths,
+        'prob_any_breach': any_breach / n_paths,
+        'percentiles': tuple(percentiles),
+        'surplus_bands': np.percentile(surplus_samples, percentiles, axis=0),
+        'dscr_bands': np.percentile(dscr_samples, percentiles, axis=0),
+    }